@@ -1,2 +1,12 @@
 from .structs import *
 from .algo import *
+from .archive import *
+from .urlindex import *
+from .checksum import *
+from .aio import *
+from .redirects import *
+from .writer import *
+from .metrics import *
+from .shmcache import *
+from .buffers import *
+from .prefetch import *
@@ -0,0 +1,119 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from .archive import Archive, ClusterCache, DEFAULT_CACHE_SIZE
+from .structs import Cluster
+
+__all__ = ["AsyncArchive"]
+
+
+def _decompress_cluster(cluster):
+    cluster.data
+    return cluster
+
+
+_process_archives = {}
+
+
+def _decompress_cluster_in_process(filename, number):
+    try:
+        archive = _process_archives[filename]
+    except KeyError:
+        archive = _process_archives[filename] = Archive.open(filename, cache_size=0)
+    cluster = Cluster(archive.buf, archive.clusterPtrList[number])
+    return bytes(cluster.data[0])
+
+
+class AsyncArchive:
+    """An asyncio front end on an `Archive`.
+
+    Clusters are decompressed in `executor` (the loop default executor if
+    None), which may be a thread or a process pool. With a process pool the
+    archive must have been opened from a file, each process opening it too.
+    Concurrent requests of the same cluster wait for a single decompression.
+    """
+
+    def __init__(self, archive, executor=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.archive = archive
+        self.executor = executor
+        self.cache = ClusterCache(cache_size)
+        # Number of requests merged into an already running decompression.
+        self.merged = 0
+        self._pending = {}
+
+    @classmethod
+    def open(cls, filename, executor=None, cache_size=DEFAULT_CACHE_SIZE):
+        # The clusters are cached by the AsyncArchive.
+        return cls(Archive.open(filename, cache_size=0), executor, cache_size)
+
+    def close(self):
+        self.cache.clear()
+        self.archive.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def get_by_url(self, ns, url):
+        """Return the dirent of (ns, url), or raise IndexError."""
+        return self.archive.get_dirent(self.archive.find_by_url(ns, url))
+
+    async def get_cluster(self, number):
+        cluster = self.cache.get(number)
+        if cluster is not None:
+            return cluster
+        task = self._pending.get(number)
+        if task is None:
+            task = asyncio.ensure_future(self._load_cluster(number))
+            self._pending[number] = task
+            task.add_done_callback(lambda _task: self._pending.pop(number, None))
+        else:
+            self.merged += 1
+        # A cancelled request must not cancel the decompression others wait for.
+        return await asyncio.shield(task)
+
+    async def _load_cluster(self, number):
+        if not 0 <= number < self.archive.clusterCount:
+            raise IndexError(number)
+        offset = self.archive.clusterPtrList[number]
+        cluster = Cluster(self.archive.buf, offset)
+        if not cluster.compressed:
+            return cluster
+        loop = asyncio.get_running_loop()
+        if isinstance(self.executor, ProcessPoolExecutor):
+            data = await loop.run_in_executor(
+                self.executor,
+                _decompress_cluster_in_process,
+                self.archive.filename,
+                number,
+            )
+            cluster = Cluster.from_decompressed(self.archive.buf, offset, data)
+        else:
+            cluster = await loop.run_in_executor(
+                self.executor, _decompress_cluster, cluster
+            )
+        self.cache.put(number, cluster, cluster.decompressed_size)
+        return cluster
+
+    async def get_blob(self, dirent):
+        cluster = await self.get_cluster(dirent.clusterNumber)
+        return cluster.get_blob_data(dirent.blobNumber)
@@ -1,43 +1,218 @@
+from . import metrics
 from .structs import *
+from .structs import CTYPES, unpack_from
 
+__all__ = [
+    "bisect",
+    "findByUrl",
+    "findByTitle",
+    "findMany",
+    "iterByUrlPrefix",
+    "iterByTitlePrefix",
+    "UrlSearch",
+    "TitleSearch",
+]
 
-class CompUrl:
-    def __init__(self, header, ns, url):
-        self.header = header
-        self.ns = ns
-        self.url = url
 
-    def __call__(self, index):
-        urlPtrList = UrlPtrList(self.header.buf, self.header.urlPtrPos)
-        d = Dirent(self.header.buf, urlPtrList[index])
-        if d.namespace == self.ns and d.url == self.url:
-            return 0
+_UINT16 = CTYPES["c_uint16"]
 
-        if d.namespace < self.ns or (d.namespace == self.ns and d.url < self.url):
-            return -1
-        else:
-            return 1
-
-
-class CompTitle:
-    def __init__(self, header, ns, title):
-        self.header = header
-        self.ns = ns
-        self.title = title
-
-    def __call__(self, index):
-        titlePtrList = TitlePtrList(self.header.buf, self.header.titlePtrPos)
-        urlIndex = titlePtrList[index]
-        urlPtrList = UrlPtrList(self.header.buf, self.header.urlPtrPos)
-        d = Dirent(self.header.buf, urlPtrList[urlIndex])
-        title = d.title or d.url
-        if d.namespace == self.ns and title == self.title:
-            return 0
-
-        if d.namespace < self.ns or (d.namespace == self.ns and title < self.title):
-            return -1
-        else:
-            return 1
+
+def _dirent_size(buf, offset):
+    """The size of the fixed part of the dirent at `offset`."""
+    mimetype = unpack_from(_UINT16, buf, offset)[0]
+    if mimetype == 0xFFFF:
+        return 12
+    if mimetype in (0xFFFE, 0xFFFD):
+        return 8
+    return 16
+
+
+def _as_key(ns, value):
+    if isinstance(ns, str):
+        ns = ns.encode()
+    if not isinstance(ns, int):
+        ns = ns[0]
+    if isinstance(value, str):
+        value = value.encode()
+    return ns, value
+
+
+class _DirentSearch:
+    """Binary search over dirents, comparing raw bytes from the buffer.
+
+    Keys are (namespace, bytes) and are never decoded. The keys of the first
+    `CACHED_LEVELS` levels of the search tree (always probed by a search on
+    the whole range) are kept in memory.
+    """
+
+    CACHED_LEVELS = 10
+
+    # Label of the lookup metrics.
+    ORDER = None
+
+    def __init__(self, header, urlPtrList=None):
+        self.buf = header.buf
+        self.count = header.articleCount
+        if urlPtrList is None:
+            urlPtrList = UrlPtrList(header.buf, header.urlPtrPos, header.articleCount)
+        self.urlPtrList = urlPtrList
+        self._cache = {}
+
+    def dirent_offset(self, index):
+        raise NotImplementedError
+
+    def _value_bounds(self, offset):
+        """Return the (start, end) of the compared value of a dirent."""
+        raise NotImplementedError
+
+    def key(self, index):
+        offset = self.dirent_offset(index)
+        start, end = self._value_bounds(offset)
+        return self.buf[offset + 3], self.buf[start:end]
+
+    def _is_lower(self, index, ns, value, or_equal):
+        offset = self.dirent_offset(index)
+        dirent_ns = self.buf[offset + 3]
+        if dirent_ns != ns:
+            return dirent_ns < ns
+        start, end = self._value_bounds(offset)
+        dirent_value = self.buf[start:end]
+        if or_equal:
+            return dirent_value <= value
+        return dirent_value < value
+
+    def _bound(self, ns, value, low, high, or_equal):
+        if high is None:
+            high = self.count
+        key = _as_key(ns, value)
+        ns, value = key
+        cache = self._cache if (low, high) == (0, self.count) else None
+        depth = 0
+        while low < high:
+            middle = (low + high) // 2
+            if cache is not None and depth < self.CACHED_LEVELS:
+                try:
+                    dirent_key = cache[middle]
+                except KeyError:
+                    dirent_key = cache[middle] = self.key(middle)
+                lower = dirent_key <= key if or_equal else dirent_key < key
+            else:
+                lower = self._is_lower(middle, ns, value, or_equal)
+            if lower:
+                low = middle + 1
+            else:
+                high = middle
+            depth += 1
+        if metrics.enabled:
+            metrics.record("lookup_probes", depth, order=self.ORDER)
+        return low
+
+    def lower_bound(self, ns, value, low=0, high=None):
+        """Return the first index in [low, high) whose key is not lower than
+        (ns, value)."""
+        return self._bound(ns, value, low, high, False)
+
+    def upper_bound(self, ns, value, low=0, high=None):
+        """Return the first index in [low, high) whose key is greater than
+        (ns, value)."""
+        return self._bound(ns, value, low, high, True)
+
+    def find(self, ns, value):
+        """Return the index of (ns, value), or raise IndexError."""
+        index = self.lower_bound(ns, value)
+        if index < self.count and self.key(index) == _as_key(ns, value):
+            return index
+        raise IndexError
+
+    def find_many(self, keys):
+        """Return the indexes of the (ns, value) `keys`, None for the missing
+        ones, in the order of `keys`.
+
+        The keys are sorted and searched in one forward pass: each search
+        starts where the previous one ended and gallops (1, 2, 4... entries
+        ahead) to bound the range it bisects. Close keys cost a few probes
+        and the dirents are read in increasing order.
+        """
+        keys = [_as_key(ns, value) for ns, value in keys]
+        results = [None] * len(keys)
+        low = 0
+        previous = previous_result = None
+        for position in sorted(range(len(keys)), key=keys.__getitem__):
+            key = keys[position]
+            if key == previous:
+                results[position] = previous_result
+                continue
+            ns, value = key
+            high = low
+            step = 1
+            while high < self.count and self._is_lower(high, ns, value, False):
+                low = high + 1
+                high = low + step
+                step *= 2
+            low = self.lower_bound(ns, value, low, min(high, self.count))
+            result = None
+            if low < self.count and self.key(low) == key:
+                result = low
+            results[position] = previous_result = result
+            previous = key
+        return results
+
+    def iter_prefix(self, ns, prefix, limit=None):
+        """Yield, in order, the indexes of the entries of namespace `ns`
+        starting with `prefix`.
+
+        At most `limit` indexes are yielded if `limit` is not None.
+        """
+        ns, prefix = _as_key(ns, prefix)
+        index = self.lower_bound(ns, prefix)
+        end = self.count if limit is None else min(self.count, index + limit)
+        while index < end:
+            dirent_ns, value = self.key(index)
+            if dirent_ns != ns or not value.startswith(prefix):
+                return
+            yield index
+            index += 1
+
+
+class UrlSearch(_DirentSearch):
+    """Search in url order (index in the UrlPtrList)."""
+
+    ORDER = "url"
+
+    def dirent_offset(self, index):
+        return self.urlPtrList[index]
+
+    def _value_bounds(self, offset):
+        start = offset + _dirent_size(self.buf, offset)
+        return start, self.buf.find(b"\0", start)
+
+
+class TitleSearch(_DirentSearch):
+    """Search in title order (index in the TitlePtrList).
+
+    Entries without title are sorted by their url.
+    """
+
+    ORDER = "title"
+
+    def __init__(self, header, urlPtrList=None, titlePtrList=None):
+        super().__init__(header, urlPtrList)
+        if titlePtrList is None:
+            titlePtrList = TitlePtrList(
+                header.buf, header.titlePtrPos, header.articleCount
+            )
+        self.titlePtrList = titlePtrList
+
+    def dirent_offset(self, index):
+        return self.urlPtrList[self.titlePtrList[index]]
+
+    def _value_bounds(self, offset):
+        start = offset + _dirent_size(self.buf, offset)
+        end = self.buf.find(b"\0", start)
+        title_end = self.buf.find(b"\0", end + 1)
+        if title_end == end + 1:
+            return start, end
+        return end + 1, title_end
 
 
 def bisect(comparator, low, high):
@@ -47,18 +222,47 @@ def bisect(comparator, low, high):
         if comp == 0:
             return middle
         if comp < 0:
-            low = middle
+            low = middle + 1
         else:
             high = middle
 
     raise IndexError
 
 
+def _searches(header):
+    """Return (UrlSearch, TitleSearch) for the functional API.
+
+    Their pointer lists are unsized: they don't export a view on the
+    caller's buffer, which would outlive the call in a traceback or an
+    unfinished generator and prevent closing a mmap.
+    """
+    urlPtrList = UrlPtrList(header.buf, header.urlPtrPos)
+    titlePtrList = TitlePtrList(header.buf, header.titlePtrPos)
+    return (
+        UrlSearch(header, urlPtrList),
+        TitleSearch(header, urlPtrList, titlePtrList),
+    )
+
+
 def findByUrl(header, ns, url):
-    urlComp = CompUrl(header, ns, url)
-    return bisect(urlComp, 0, header.articleCount)
+    return _searches(header)[0].find(ns, url)
 
 
 def findByTitle(header, ns, title):
-    titleComp = CompTitle(header, ns, title)
-    return bisect(titleComp, 0, header.articleCount)
+    return _searches(header)[1].find(ns, title)
+
+
+def findMany(header, ns_urls):
+    return _searches(header)[0].find_many(ns_urls)
+
+
+def iterByUrlPrefix(header, ns, prefix, limit=None):
+    urlSearch = _searches(header)[0]
+    for index in urlSearch.iter_prefix(ns, prefix, limit):
+        yield DirentRecord(header.buf, urlSearch.urlPtrList[index])
+
+
+def iterByTitlePrefix(header, ns, prefix, limit=None):
+    titleSearch = _searches(header)[1]
+    for index in titleSearch.iter_prefix(ns, prefix, limit):
+        yield DirentRecord(header.buf, titleSearch.dirent_offset(index))
@@ -0,0 +1,467 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import mmap
+import os
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from operator import attrgetter
+
+from .buffers import (
+    PreadBuffer,
+    split_parts,
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_CACHE_PAGES,
+)
+from .structs import (
+    UrlPtrList,
+    TitlePtrList,
+    ClusterPtrList,
+    Header,
+    DirentRecord,
+    Cluster,
+    dirent_blob,
+)
+from .prefetch import ClusterPrefetcher
+from .algo import UrlSearch, TitleSearch, _as_key
+from .urlindex import UrlIndex, SUFFIX as URL_INDEX_SUFFIX
+from .redirects import (
+    RedirectTable,
+    REDIRECT_LOOP,
+    REDIRECT_DANGLING,
+    SUFFIX as REDIRECTS_SUFFIX,
+)
+
+__all__ = ["Archive", "ClusterCache"]
+
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+class ClusterCache:
+    """LRU cache of clusters, bounded by the size of their decompressed data.
+
+    The cache can be shared by several threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            try:
+                cluster, _size = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cluster
+
+    def put(self, key, cluster, size):
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_size:
+                # Caching it would flush everything else for a single entry.
+                return
+            self._entries[key] = (cluster, size)
+            self.size += size
+            while self.size > self.max_size:
+                _key, (_cluster, old_size) = self._entries.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": self.size,
+                "max_size": self.max_size,
+            }
+
+
+class Archive:
+    """A zim archive kept open for repeated random access.
+
+    The archive owns the header and the pointer lists, and keeps the
+    decompressed clusters in a `ClusterCache` so that reading several blobs
+    of the same cluster only decompresses it once.
+
+    An archive can be used by several threads: the header and pointer lists
+    are read only, and all the threads reading a cluster share the same
+    `Cluster` (and wait for the same decompression), while clusters are
+    decompressed in parallel.
+    """
+
+    def __init__(self, buf, cache_size=DEFAULT_CACHE_SIZE, shared_cache=None):
+        self.buf = buf
+        self.header = Header(buf, 0)
+        self.mimetypes = self.header.mimetypeList
+        self.urlPtrList = UrlPtrList(
+            buf, self.header.urlPtrPos, self.header.articleCount
+        )
+        self.titlePtrList = TitlePtrList(
+            buf, self.header.titlePtrPos, self.header.articleCount
+        )
+        self.clusterPtrList = ClusterPtrList(
+            buf, self.header.clusterPtrPos, self.header.clusterCount
+        )
+        self.urlSearch = UrlSearch(self.header, self.urlPtrList)
+        self.titleSearch = TitleSearch(
+            self.header, self.urlPtrList, self.titlePtrList
+        )
+        self.cache = ClusterCache(cache_size)
+        # The clusters in use, cached or not, so that concurrent readers of a
+        # cluster share it.
+        self._clusters = weakref.WeakValueDictionary()
+        self._clusters_lock = threading.Lock()
+        self._redirects_lock = threading.Lock()
+        # A `SharedClusterCache`, to decompress clusters once per host. The
+        # clusters are then not kept in `cache`: a copy per process would
+        # defeat its purpose, but a cluster is copied from the segment each
+        # time it is needed and not in use by another reader.
+        self.sharedCache = shared_cache
+        self.urlIndex = None
+        self.redirectTable = None
+        self.filename = None
+        self._file = None
+        self._owns_buf = False
+
+    @classmethod
+    def open(
+        cls,
+        filename,
+        pread=False,
+        page_size=DEFAULT_PAGE_SIZE,
+        cache_pages=DEFAULT_CACHE_PAGES,
+        **kwargs
+    ):
+        """Open the zim file `filename`, which may be a split archive.
+
+        The file is mapped in memory, unless it is split or `pread` is true:
+        it is then read with `os.pread` through a cache of `cache_pages`
+        pages of `page_size` bytes (see `PreadBuffer`).
+        """
+        parts = split_parts(filename)
+        if parts is not None or pread:
+            f = None
+            buf = PreadBuffer(parts or [filename], page_size, cache_pages)
+        else:
+            f = open(filename, "rb")
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except BaseException:
+                f.close()
+                raise
+        try:
+            archive = cls(buf, **kwargs)
+        except BaseException:
+            buf.close()
+            if f is not None:
+                f.close()
+            raise
+        archive.filename = filename
+        archive._file = f
+        archive._owns_buf = True
+        index_path = str(filename) + URL_INDEX_SUFFIX
+        if os.path.exists(index_path):
+            try:
+                archive.load_url_index(index_path)
+            except ValueError:
+                # Stale or broken index, ignore it.
+                pass
+        redirects_path = str(filename) + REDIRECTS_SUFFIX
+        if os.path.exists(redirects_path):
+            try:
+                archive.redirectTable = RedirectTable.load(
+                    redirects_path, archive.header
+                )
+            except ValueError:
+                pass
+        return archive
+
+    def load_url_index(self, path):
+        """Use the sidecar url index at `path` (see `build_url_index`)."""
+        urlIndex = UrlIndex(path, self.header)
+        if self.urlIndex is not None:
+            self.urlIndex.close()
+        self.urlIndex = urlIndex
+
+    def close(self):
+        self.cache.clear()
+        if self.urlIndex is not None:
+            self.urlIndex.close()
+            self.urlIndex = None
+        for ptrList in (self.urlPtrList, self.titlePtrList, self.clusterPtrList):
+            ptrList.release()
+        if self._owns_buf:
+            self.buf.close()
+            self._owns_buf = False
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def fileno(self):
+        """Return the file descriptor of the archive, None if it is not
+        read from a file."""
+        return None if self._file is None else self._file.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def articleCount(self):
+        return self.header.articleCount
+
+    @property
+    def clusterCount(self):
+        return self.header.clusterCount
+
+    def get_dirent(self, index):
+        if not 0 <= index < self.header.articleCount:
+            raise IndexError(index)
+        return DirentRecord(self.buf, self.urlPtrList[index])
+
+    def get_dirent_by_title(self, index):
+        if not 0 <= index < self.header.articleCount:
+            raise IndexError(index)
+        return self.get_dirent(self.titlePtrList[index])
+
+    def resolve_redirect(self, index):
+        """Return the index of the article the entry `index` leads to,
+        following the redirects.
+
+        The `RedirectTable` is built at the first call (unless it has been
+        loaded when opening the archive). Raise IndexError for redirect loops
+        and dangling redirects.
+        """
+        if not 0 <= index < self.header.articleCount:
+            raise IndexError(index)
+        target = self._get_redirect_table()[index]
+        if target == REDIRECT_LOOP:
+            raise IndexError("Redirect loop from entry {}".format(index))
+        if target == REDIRECT_DANGLING:
+            raise IndexError("Dangling redirect from entry {}".format(index))
+        return target
+
+    def save_redirect_table(self, path=None):
+        """Build (if needed) and save the redirect table, by default next to
+        the archive file, where `Archive.open` finds it."""
+        if path is None:
+            path = str(self.filename) + REDIRECTS_SUFFIX
+        self._get_redirect_table().save(path, self.header)
+
+    def _get_redirect_table(self):
+        with self._redirects_lock:
+            if self.redirectTable is None:
+                self.redirectTable = RedirectTable.build(self)
+            return self.redirectTable
+
+    def get_mimetype(self, dirent):
+        return self.mimetypes[dirent.mimetype]
+
+    def get_cluster(self, number):
+        if not 0 <= number < self.header.clusterCount:
+            raise IndexError(number)
+        if self.sharedCache is None:
+            cluster = self.cache.get(number)
+            if cluster is not None:
+                return cluster
+        with self._clusters_lock:
+            cluster = self._clusters.get(number)
+        if cluster is None:
+            # Not under the lock: it may copy a cluster from the shared cache.
+            cluster = self._new_cluster(number)
+            with self._clusters_lock:
+                # Another thread may have created it meanwhile.
+                cluster = self._clusters.setdefault(number, cluster)
+        if cluster.compressed and self.sharedCache is not None:
+            self._share_cluster(number, cluster)
+        self._account(number, cluster)
+        return cluster
+
+    def _account(self, number, cluster):
+        """Charge the cache for the data decompressed so far of `cluster`."""
+        # Uncompressed clusters are read straight from the buffer, there is
+        # nothing worth caching for them.
+        if cluster.compressed and self.sharedCache is None:
+            self.cache.put(number, cluster, cluster.decompressed_size)
+
+    def _new_cluster(self, number):
+        offset = self.clusterPtrList[number]
+        if self.sharedCache is not None:
+            data = self.sharedCache.get(self.header.uuid, number)
+            if data is not None:
+                return Cluster.from_decompressed(self.buf, offset, data)
+        return Cluster(self.buf, offset)
+
+    def _share_cluster(self, number, cluster):
+        # Other processes need the whole content.
+        with cluster._lock:
+            if cluster.fully_decompressed:
+                return
+            data, _offset = cluster.data
+            self.sharedCache.put(self.header.uuid, number, data)
+
+    def get_blob_data(self, dirent):
+        cluster = self.get_cluster(dirent.clusterNumber)
+        blob = cluster.get_blob_data(dirent.blobNumber)
+        # Clusters are decompressed on demand, account for what this read
+        # has decompressed.
+        self._account(dirent.clusterNumber, cluster)
+        return blob
+
+    def get_blob_view(self, dirent):
+        cluster = self.get_cluster(dirent.clusterNumber)
+        view = cluster.get_blob_view(dirent.blobNumber)
+        self._account(dirent.clusterNumber, cluster)
+        return view
+
+    def open_blob(self, dirent):
+        number = dirent.clusterNumber
+        cluster = self.get_cluster(number)
+        if not cluster.compressed:
+            return cluster.open_blob(dirent.blobNumber)
+        accounted = [cluster.decompressed_size]
+
+        def on_read(cluster):
+            # Account for what the reads decompress.
+            size = cluster.decompressed_size
+            if size != accounted[0]:
+                accounted[0] = size
+                self._account(number, cluster)
+
+        return cluster.open_blob(dirent.blobNumber, on_read)
+
+    def cluster_order(self):
+        """Group the articles by cluster.
+
+        Return `(starts, indexes)` arrays, the url indexes of the articles of
+        the cluster `n` being `indexes[starts[n]:starts[n+1]]`.
+        This is a counting sort, using 4 bytes per article and per cluster.
+        """
+        buf = self.buf
+        urlPtrList = self.urlPtrList
+        starts = array("I", [0]) * (self.header.clusterCount + 1)
+        for offset in urlPtrList:
+            location = dirent_blob(buf, offset)
+            if location is not None:
+                starts[location[0] + 1] += 1
+        for number in range(self.header.clusterCount):
+            starts[number + 1] += starts[number]
+        positions = array("I", starts)
+        indexes = array("I", [0]) * starts[-1]
+        for index, offset in enumerate(urlPtrList):
+            location = dirent_blob(buf, offset)
+            if location is not None:
+                indexes[positions[location[0]]] = index
+                positions[location[0]] += 1
+        return starts, indexes
+
+    def iter_cluster_articles(self, number, indexes, cluster=None):
+        """Yield `(dirent, blob)` for the articles of url indexes `indexes`,
+        all stored in the cluster `number`, in blob order.
+
+        The cluster is read outside of the cluster cache, unless it is given
+        as `cluster`.
+        """
+        dirents = [self.get_dirent(index) for index in indexes]
+        dirents.sort(key=attrgetter("blobNumber"))
+        if cluster is None:
+            cluster = Cluster(self.buf, self.clusterPtrList[number])
+        for dirent in dirents:
+            yield dirent, cluster.get_blob_data(dirent.blobNumber)
+
+    def iter_articles_by_cluster(self, prefetch=0):
+        """Yield `(dirent, blob)` for all the articles, cluster by cluster.
+
+        Each cluster is decompressed once and dropped once its articles have
+        been yielded, without going through the cluster cache.
+        With `prefetch`, the next `prefetch` clusters are read and
+        decompressed in background threads (see `ClusterPrefetcher`).
+        """
+        starts, indexes = self.cluster_order()
+        numbers = [
+            number
+            for number in range(self.header.clusterCount)
+            if starts[number] != starts[number + 1]
+        ]
+        if prefetch:
+            clusters = ClusterPrefetcher(self, numbers, depth=prefetch)
+        else:
+            clusters = ((number, None) for number in numbers)
+        for number, cluster in clusters:
+            yield from self.iter_cluster_articles(
+                number, indexes[starts[number] : starts[number + 1]], cluster
+            )
+
+    def find_by_url(self, ns, url):
+        if self.urlIndex is not None:
+            key = _as_key(ns, url)
+            for index in self.urlIndex.candidates(ns, url):
+                if self.urlSearch.key(index) == key:
+                    return index
+            raise IndexError
+        return self.urlSearch.find(ns, url)
+
+    def find_many(self, ns_urls):
+        """Return the url indexes of the (ns, url) of `ns_urls`, None for
+        the missing ones, in the same order. This is much faster than
+        `find_by_url` for many urls (see `UrlSearch.find_many`)."""
+        return self.urlSearch.find_many(ns_urls)
+
+    def find_by_title(self, ns, title):
+        return self.titleSearch.find(ns, title)
+
+    def iter_by_url_prefix(self, ns, prefix, limit=None):
+        """Yield the dirents of namespace `ns` whose url starts with `prefix`,
+        in url order."""
+        for index in self.urlSearch.iter_prefix(ns, prefix, limit):
+            yield self.get_dirent(index)
+
+    def iter_by_title_prefix(self, ns, prefix, limit=None):
+        """Yield the dirents of namespace `ns` whose title starts with
+        `prefix`, in title order."""
+        for index in self.titleSearch.iter_prefix(ns, prefix, limit):
+            yield self.get_dirent_by_title(index)
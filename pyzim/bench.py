@@ -0,0 +1,203 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .archive import Archive
+from .synthetic import generate_zim
+
+__all__ = ["run_benchmarks"]
+
+
+def _latency_stats(samples):
+    samples = sorted(samples)
+    count = len(samples)
+    if not count:
+        return {"count": 0}
+
+    def percentile(p):
+        return samples[min(count - 1, int(p * count))] * 1e6
+
+    return {
+        "count": count,
+        "mean_us": sum(samples) / count * 1e6,
+        "p50_us": percentile(0.5),
+        "p99_us": percentile(0.99),
+        "max_us": samples[-1] * 1e6,
+    }
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def _bench_open(path, repeat):
+    def open_close():
+        Archive.open(path).close()
+
+    return _latency_stats([_timed(open_close) for _ in range(repeat)])
+
+
+def _bench_lookups(archive, indexes):
+    urls = []
+    titles = []
+    for index in indexes:
+        dirent = archive.get_dirent(index)
+        urls.append((dirent.namespace, dirent.url))
+        title_dirent = archive.get_dirent_by_title(index)
+        titles.append((title_dirent.namespace, title_dirent.title or title_dirent.url))
+    return {
+        "find_by_url": _latency_stats(
+            [_timed(archive.find_by_url, *url) for url in urls]
+        ),
+        "find_by_title": _latency_stats(
+            [_timed(archive.find_by_title, *title) for title in titles]
+        ),
+    }
+
+
+def _bench_reads(path, indexes):
+    results = {}
+    # Without cache, each read decompresses its cluster.
+    with Archive.open(path, cache_size=0) as archive:
+        dirents = [archive.get_dirent(i) for i in indexes]
+        dirents = [d for d in dirents if d.kind == "article"]
+        results["blob_read_cold"] = _latency_stats(
+            [_timed(archive.get_blob_data, d) for d in dirents]
+        )
+    with Archive.open(path) as archive:
+        for dirent in dirents:
+            archive.get_blob_data(dirent)
+        results["blob_read_warm"] = _latency_stats(
+            [_timed(archive.get_blob_data, d) for d in dirents]
+        )
+    return results
+
+
+def _bench_iteration(path, prefetch=0):
+    with Archive.open(path) as archive:
+        articles = size = 0
+        start = time.perf_counter()
+        for _dirent, blob in archive.iter_articles_by_cluster(prefetch):
+            articles += 1
+            size += len(blob)
+        duration = time.perf_counter() - start
+
+        tracemalloc.start()
+        for _ in archive.iter_articles_by_cluster(prefetch):
+            pass
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "seconds": duration,
+        "articles": articles,
+        "bytes": size,
+        "articles_per_second": articles / duration if duration else None,
+        "bytes_per_second": size / duration if duration else None,
+        "python_memory_peak": peak,
+    }
+
+
+def run_benchmarks(path, lookups=1000, open_repeat=20, seed=0):
+    """Run the benchmarks on the zim file `path` and return the results.
+
+    Latencies are reported in microseconds, `lookups` random entries being
+    looked up and read.
+    """
+    rng = random.Random(seed)
+    with Archive.open(path) as archive:
+        count = archive.articleCount
+        indexes = [rng.randrange(count) for _ in range(min(lookups, count))]
+        results = {"open": _bench_open(path, open_repeat)}
+        results.update(_bench_lookups(archive, indexes))
+    results.update(_bench_reads(path, indexes))
+    results["iteration"] = _bench_iteration(path)
+    results["iteration_prefetch"] = _bench_iteration(path, prefetch=4)
+    return results
+
+
+def _max_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # In KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark pyzim on a synthetic (or given) zim file."
+    )
+    parser.add_argument("--zim", help="Benchmark this zim file instead.")
+    parser.add_argument("--articles", type=int, default=100000)
+    parser.add_argument("--cluster-size", type=int, default=1024 * 1024)
+    parser.add_argument("--blob-size", type=int, default=4096)
+    parser.add_argument(
+        "--compression", choices=["none", "xz", "zstd"], default="xz"
+    )
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Json output file (default stdout).")
+    args = parser.parse_args(argv)
+
+    report = {
+        "version": 1,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.zim
+        if path is None:
+            path = os.path.join(tmpdir, "bench.zim")
+            start = time.perf_counter()
+            report["archive"] = generate_zim(
+                path,
+                articles=args.articles,
+                cluster_size=args.cluster_size,
+                blob_size=args.blob_size,
+                compression=args.compression,
+                seed=args.seed,
+            )
+            report["archive"]["generation_seconds"] = time.perf_counter() - start
+        else:
+            report["archive"] = {"path": path, "file_size": os.path.getsize(path)}
+        report["results"] = run_benchmarks(path, lookups=args.lookups, seed=args.seed)
+    report["max_rss_kib"] = _max_rss()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
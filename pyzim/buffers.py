@@ -0,0 +1,173 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import bisect
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+__all__ = ["PreadBuffer", "split_parts"]
+
+
+DEFAULT_PAGE_SIZE = 64 * 1024
+DEFAULT_CACHE_PAGES = 256
+
+
+def split_parts(path):
+    """Return the part files of the archive `path`.
+
+    A split archive `foo.zim` is stored in `foo.zimaa`, `foo.zimab`... and
+    may be given by its name or by the name of its first part. Return None if
+    `path` is not a split archive.
+    """
+    path = str(path)
+    if path.endswith("aa") and not os.path.exists(path[:-2]):
+        path = path[:-2]
+    if os.path.exists(path):
+        return None
+    parts = sorted(glob.glob(glob.escape(path) + "[a-z][a-z]"))
+    if not parts or parts[0] != path + "aa":
+        return None
+    return parts
+
+
+class PreadBuffer:
+    """A read only buffer on the concatenation of `paths`, read with
+    `os.pread` through a LRU cache of `cache_pages` pages of `page_size` bytes.
+
+    It is an alternative to mmap for split archives or when mapping the file
+    is not possible (address space limits). It supports the operations pyzim
+    needs from a buffer: len, indexing, slicing and find. Slices larger than
+    a page are read directly, without going through the cache.
+    It doesn't implement the buffer protocol: struct and memoryview can't be
+    used on it (see `structs.unpack_from`).
+    """
+
+    def __init__(
+        self, paths, page_size=DEFAULT_PAGE_SIZE, cache_pages=DEFAULT_CACHE_PAGES
+    ):
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._fds = []
+        self._starts = [0]
+        try:
+            for path in paths:
+                fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                self._fds.append(fd)
+                self._starts.append(self._starts[-1] + os.fstat(fd).st_size)
+        except BaseException:
+            self.close()
+            raise
+        self.size = self._starts[-1]
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._pages = OrderedDict()
+        self.closed = True
+
+    def __len__(self):
+        return self.size
+
+    def _read(self, offset, size):
+        """Read `size` bytes at `offset`, across the parts."""
+        size = min(size, self.size - offset)
+        chunks = []
+        part = bisect.bisect_right(self._starts, offset) - 1
+        while size > 0:
+            part_offset = offset - self._starts[part]
+            length = min(size, self._starts[part + 1] - offset)
+            if not length:
+                # Empty part.
+                part += 1
+                continue
+            chunk = os.pread(self._fds[part], length, part_offset)
+            if not chunk:
+                raise OSError("Unexpected end of part {}".format(part))
+            chunks.append(chunk)
+            offset += len(chunk)
+            size -= len(chunk)
+            if offset == self._starts[part + 1]:
+                part += 1
+        return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+    def _page(self, number):
+        with self._lock:
+            page = self._pages.get(number)
+            if page is not None:
+                self._pages.move_to_end(number)
+                return page
+        page = self._read(number * self.page_size, self.page_size)
+        with self._lock:
+            self._pages[number] = page
+            while len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+        return page
+
+    def _slice(self, start, stop):
+        if stop <= start:
+            return b""
+        if stop - start > self.page_size:
+            return self._read(start, stop - start)
+        first, last = start // self.page_size, (stop - 1) // self.page_size
+        begin = start - first * self.page_size
+        if first == last:
+            return self._page(first)[begin : begin + stop - start]
+        # At most two pages.
+        return (self._page(first) + self._page(last))[begin : begin + stop - start]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                return bytes(self[i] for i in range(start, stop, step))
+            return self._slice(start, stop)
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("index out of range")
+        page = self._page(index // self.page_size)
+        return page[index % self.page_size]
+
+    def find(self, sub, start=0, end=None):
+        """Like bytes.find, scanning page by page."""
+        if end is None or end > self.size:
+            end = self.size
+        if start < 0:
+            start = max(0, start + self.size)
+        overlap = len(sub) - 1
+        position = start
+        while position < end:
+            number = position // self.page_size
+            page_start = number * self.page_size
+            chunk_end = min(page_start + self.page_size, end)
+            data = self._page(number)[position - page_start : chunk_end - page_start]
+            if overlap > 0 and chunk_end < end:
+                # A match may start at the end of the page.
+                data += self._slice(chunk_end, min(chunk_end + overlap, end))
+            found = data.find(sub)
+            if found >= 0:
+                return position + found
+            position = chunk_end
+        return -1 if sub or start > end else start
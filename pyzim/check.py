@@ -0,0 +1,316 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .archive import Archive
+from .structs import Cluster, DirentRecord
+
+__all__ = ["Problem", "check_archive"]
+
+
+MAGIC_NUMBER = 72173914
+
+Problem = namedtuple("Problem", ["check", "index", "message"])
+
+
+class _Problems(list):
+    """A list of problems keeping at most `max_problems` of them."""
+
+    def __init__(self, max_problems):
+        super().__init__()
+        self.max_problems = max_problems
+        self.dropped = 0
+
+    def add(self, check, index, message):
+        if len(self) < self.max_problems:
+            self.append(Problem(check, index, message))
+        else:
+            self.dropped += 1
+
+    def result(self):
+        if self.dropped:
+            self.append(
+                Problem("truncated", None, "{} more problems".format(self.dropped))
+            )
+        return list(self)
+
+
+def _check_header(archive):
+    """Check the header.
+
+    Return the problems and whether the other checks can run: the pointer
+    lists, the mimetype list and the checksum must be in the file.
+    """
+    problems = _Problems(sys.maxsize)
+    header = archive.header
+    size = len(archive.buf)
+    usable = True
+    if header.magicNumber != MAGIC_NUMBER:
+        problems.add("header", None, "Invalid magic number")
+    for name in ("urlPtrPos", "titlePtrPos", "clusterPtrPos", "mimeListPos"):
+        if getattr(header, name) >= size:
+            problems.add("header", None, "{} is out of the file".format(name))
+            usable = False
+    for name, count, item_size in (
+        ("urlPtrPos", header.articleCount, 8),
+        ("titlePtrPos", header.articleCount, 4),
+        ("clusterPtrPos", header.clusterCount, 8),
+    ):
+        position = getattr(header, name)
+        if position < size and position + count * item_size > size:
+            problems.add(
+                "header", None, "The list at {} ends after the file".format(name)
+            )
+            usable = False
+    if header.mimeListPos >= 80 and header.checksumPos + 16 > size:
+        problems.add("header", None, "The checksum is out of the file")
+        usable = False
+    for name in ("mainPage", "layoutPage"):
+        value = getattr(header, name)
+        if value != 0xFFFFFFFF and value >= header.articleCount:
+            problems.add("header", None, "{} is out of range".format(name))
+    return problems.result(), usable
+
+
+def _read_pointer(pointers, index):
+    """The item `index` of a pointer list, None if it is out of the file."""
+    try:
+        return pointers[index]
+    except (IndexError, struct.error):
+        return None
+
+
+def _check_clusters(archive, first, last, max_problems):
+    """Check the clusters [first, last).
+
+    Return the problems and the number of blobs of each cluster.
+    """
+    problems = _Problems(max_problems)
+    nb_blobs = array("I", [0]) * (last - first)
+    size = len(archive.buf)
+    for number in range(first, last):
+        offset = _read_pointer(archive.clusterPtrList, number)
+        if offset is None or offset >= size:
+            problems.add("cluster", number, "Cluster offset is out of the file")
+            continue
+        cluster = Cluster(archive.buf, offset)
+        try:
+            nb_offsets = cluster.nb_offsets
+            if nb_offsets == 0 or cluster.offsetArray[0] % cluster.offset_size:
+                problems.add("cluster", number, "Invalid first blob offset")
+                continue
+            previous = 0
+            for index in range(nb_offsets):
+                blob_offset = cluster.get_blob_offset(index)
+                if blob_offset < previous:
+                    problems.add(
+                        "cluster", number, "Blob offset {} decreases".format(index)
+                    )
+                previous = blob_offset
+            data, data_offset = cluster.data
+            if data_offset + previous > len(data):
+                problems.add("cluster", number, "Blobs end after the cluster data")
+        except (EOFError, ValueError, RuntimeError, IndexError, struct.error) as e:
+            problems.add("cluster", number, "Cannot read cluster ({})".format(e))
+            continue
+        nb_blobs[number - first] = nb_offsets - 1
+    return problems.result(), nb_blobs
+
+
+def _read_key(search, index):
+    """The sort key of the entry `index` of `search`, None if its dirent
+    cannot be read (offset out of the file)."""
+    try:
+        return search.key(index)
+    except (IndexError, struct.error):
+        return None
+
+
+def _check_dirents(archive, first, last, nb_blobs, max_problems):
+    """Check the dirents [first, last) and their url and title order."""
+    problems = _Problems(max_problems)
+    header = archive.header
+    size = len(archive.buf)
+    nb_mimetypes = len(archive.mimetypes)
+    urlSearch = archive.urlSearch
+    titleSearch = archive.titleSearch
+    # The problems of the entry before the shard are reported by the shard
+    # checking it.
+    previous_url = _read_key(urlSearch, first - 1) if first else None
+    previous_title = None
+    if first:
+        title_pointer = _read_pointer(archive.titlePtrList, first - 1)
+        if title_pointer is not None and title_pointer < header.articleCount:
+            previous_title = _read_key(titleSearch, first - 1)
+    for index in range(first, last):
+        offset = _read_pointer(archive.urlPtrList, index)
+        if offset is None or offset >= size:
+            problems.add("dirent", index, "Dirent offset is out of the file")
+            previous_url = None
+            continue
+        try:
+            dirent = DirentRecord(archive.buf, offset)
+        except (UnicodeDecodeError, struct.error) as e:
+            problems.add("dirent", index, "Cannot read dirent ({})".format(e))
+            previous_url = None
+            continue
+        if dirent.kind == "article":
+            if dirent.mimetype >= nb_mimetypes:
+                problems.add("mimetype", index, "Invalid mimetype index")
+            if dirent.clusterNumber >= header.clusterCount:
+                problems.add("cluster_number", index, "Invalid cluster number")
+            elif dirent.blobNumber >= nb_blobs[dirent.clusterNumber]:
+                problems.add("blob_number", index, "Invalid blob number")
+        elif dirent.kind == "redirect":
+            if dirent.redirect_index >= header.articleCount:
+                problems.add("redirect", index, "Redirect target out of range")
+
+        url = _read_key(urlSearch, index)
+        if url is None:
+            problems.add("url_order", index, "Cannot read the url")
+        elif previous_url is not None and not previous_url < url:
+            problems.add("url_order", index, "Url is not after the previous one")
+        previous_url = url
+
+        title_pointer = _read_pointer(archive.titlePtrList, index)
+        if title_pointer is None or title_pointer >= header.articleCount:
+            problems.add("title_order", index, "Title pointer out of range")
+            previous_title = None
+            continue
+        title = _read_key(titleSearch, index)
+        if title is None:
+            problems.add("title_order", index, "Cannot read the title dirent")
+        elif previous_title is not None and title < previous_title:
+            problems.add("title_order", index, "Title is before the previous one")
+        previous_title = title
+    return problems.result()
+
+
+_worker_archive = None
+_worker_nb_blobs = None
+
+
+def _init_worker(filename, nb_blobs=None):
+    global _worker_archive, _worker_nb_blobs
+    _worker_archive = Archive.open(filename)
+    if nb_blobs is not None:
+        _worker_nb_blobs = array("I", nb_blobs)
+
+
+def _check_clusters_task(first, last, max_problems):
+    problems, nb_blobs = _check_clusters(_worker_archive, first, last, max_problems)
+    return problems, nb_blobs.tobytes()
+
+
+def _check_dirents_task(first, last, max_problems):
+    return _check_dirents(_worker_archive, first, last, _worker_nb_blobs, max_problems)
+
+
+def _shards(count, shard_size):
+    for first in range(0, count, shard_size):
+        yield first, min(first + shard_size, count)
+
+
+def check_archive(filename, workers=None, shard_size=10000, max_problems=100):
+    """Check the structure of the zim file `filename`.
+
+    This is a generator of `Problem`, yielded as soon as they are found.
+    Clusters, then dirents, are checked by shards of `shard_size` in a pool of
+    `workers` processes (all the cpus if None). Each shard reports at most
+    `max_problems` problems.
+    """
+    workers = workers or os.cpu_count() or 1
+    try:
+        archive = Archive.open(filename)
+    except (ValueError, IndexError, struct.error) as e:
+        # Mostly a file too short for a header.
+        yield Problem("header", None, "Cannot open the archive ({})".format(e))
+        return
+    with archive:
+        problems, usable = _check_header(archive)
+        yield from problems
+        if not usable:
+            return
+        header = archive.header
+        nb_blobs = array("I", [0]) * header.clusterCount
+        cluster_shards = list(_shards(header.clusterCount, shard_size))
+        dirent_shards = list(_shards(header.articleCount, shard_size))
+        if workers == 1:
+            for first, last in cluster_shards:
+                problems, shard_nb_blobs = _check_clusters(
+                    archive, first, last, max_problems
+                )
+                nb_blobs[first:last] = shard_nb_blobs
+                yield from problems
+            for first, last in dirent_shards:
+                yield from _check_dirents(archive, first, last, nb_blobs, max_problems)
+            return
+
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(filename,)
+    ) as executor:
+        futures = {
+            executor.submit(_check_clusters_task, first, last, max_problems): first
+            for first, last in cluster_shards
+        }
+        for future in as_completed(futures):
+            problems, shard_nb_blobs = future.result()
+            first = futures[future]
+            shard_nb_blobs = array("I", shard_nb_blobs)
+            nb_blobs[first : first + len(shard_nb_blobs)] = shard_nb_blobs
+            yield from problems
+
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(filename, nb_blobs.tobytes())
+    ) as executor:
+        futures = [
+            executor.submit(_check_dirents_task, first, last, max_problems)
+            for first, last in dirent_shards
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the structure of a zim file.")
+    parser.add_argument("zimfile")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes."
+    )
+    parser.add_argument("--max-problems", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    nb_problems = 0
+    for problem in check_archive(
+        args.zimfile, workers=args.workers, max_problems=args.max_problems
+    ):
+        nb_problems += 1
+        index = "" if problem.index is None else " {}".format(problem.index)
+        print("[{}{}] {}".format(problem.check, index, problem.message), flush=True)
+    print("{} problems found".format(nb_problems))
+    return 1 if nb_problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import hashlib
+import mmap
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .archive import Archive
+
+__all__ = ["compute_checksum", "verify_checksum"]
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def compute_checksum(buf, end, chunk_size=CHUNK_SIZE, progress=None):
+    """Return the md5 digest of `buf[:end]`.
+
+    The buffer is hashed by chunks of memoryview, without copy (unless it
+    doesn't support the buffer protocol). hashlib
+    releases the GIL while hashing, so several buffers can be hashed in
+    parallel threads.
+    `progress(done, end)` is called after each chunk.
+    """
+    if isinstance(buf, mmap.mmap) and hasattr(mmap, "MADV_SEQUENTIAL"):
+        buf.madvise(mmap.MADV_SEQUENTIAL)
+    md5 = hashlib.md5()
+    try:
+        view = memoryview(buf)
+    except TypeError:
+        # Not a buffer (PreadBuffer), hash the copies of its slices.
+        view = None
+    try:
+        for start in range(0, end, chunk_size):
+            stop = min(start + chunk_size, end)
+            if view is None:
+                md5.update(buf[start:stop])
+            else:
+                with view[start:stop] as chunk:
+                    md5.update(chunk)
+            if progress is not None:
+                progress(stop, end)
+    finally:
+        if view is not None:
+            view.release()
+    return md5.digest()
+
+
+def verify_checksum(archive, chunk_size=CHUNK_SIZE, progress=None):
+    """Check the md5 checksum of `archive` (an `Archive` or a file name).
+
+    Raise a ValueError if the archive has no checksum.
+    """
+    if not isinstance(archive, Archive):
+        with Archive.open(archive) as archive:
+            return verify_checksum(archive, chunk_size, progress)
+    checksumPos = archive.header.checksumPos
+    expected = bytes(archive.buf[checksumPos : checksumPos + 16])
+    if len(expected) != 16:
+        return False
+    return compute_checksum(archive.buf, checksumPos, chunk_size, progress) == expected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the checksum of zim files.")
+    parser.add_argument("zimfiles", nargs="+")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of files verified in parallel.",
+    )
+    parser.add_argument(
+        "--progress", action="store_true", help="Print the progress on stderr."
+    )
+    args = parser.parse_args(argv)
+
+    lock = threading.Lock()
+    hashed = {}
+
+    def verify(zimfile):
+        def progress(done, total):
+            with lock:
+                hashed[zimfile] = (done, total)
+                done = sum(d for d, _ in hashed.values())
+                total = sum(t for _, t in hashed.values())
+                print(
+                    "\r{:.1%}".format(done / total), end="", file=sys.stderr, flush=True
+                )
+
+        try:
+            ok = verify_checksum(zimfile, progress=progress if args.progress else None)
+        except (OSError, ValueError) as e:
+            return zimfile, "ERROR ({})".format(e)
+        return zimfile, "OK" if ok else "FAILED"
+
+    status = 0
+    with ThreadPoolExecutor(args.jobs or len(args.zimfiles)) as executor:
+        for zimfile, result in executor.map(verify, args.zimfiles):
+            with lock:
+                if args.progress:
+                    print(file=sys.stderr)
+                print("{}: {}".format(zimfile, result))
+            if result != "OK":
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
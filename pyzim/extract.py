@@ -0,0 +1,292 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import html
+import os
+import string
+import sys
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from operator import attrgetter
+from urllib.parse import quote
+
+from .archive import Archive
+from .structs import Cluster, Dirent
+
+__all__ = ["extract", "entry_path"]
+
+
+# Written in the output directory, one line per finished task.
+STATE_FILE = ".pyzim-extract"
+
+_SPECIAL_COMPONENTS = {"": "%", ".": "%2E", "..": "%2E%2E"}
+
+# Namespace bytes used as is for their directory, the others are escaped.
+_NAMESPACE_CHARS = frozenset(string.ascii_letters + string.digits + "-_")
+
+_STUB = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<meta http-equiv="refresh" content="0;url={url}">
+</head><body><a href="{url}">{url}</a></body></html>
+"""
+
+
+def entry_path(outdir, dirent):
+    """Return the path of the file for `dirent` in `outdir`.
+
+    The path is `outdir/namespace/url`. Namespaces other than a letter, a
+    digit, "-" or "_" are escaped (%XX), as are the url components which
+    would escape their directory ("", "." and "..").
+    """
+    components = [
+        "".join(
+            chr(byte) if chr(byte) in _NAMESPACE_CHARS else "%{:02X}".format(byte)
+            for byte in dirent.namespace
+        )
+        or "%00"
+    ]
+    for component in dirent.url.split("/"):
+        components.append(_SPECIAL_COMPONENTS.get(component, component))
+    return os.path.join(outdir, *components)
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _umask()
+
+
+def _write_file(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # A fixed temporary name could be the path of another entry.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        # mkstemp creates files only readable by their owner.
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _extract_clusters(archive, outdir, first, starts, indexes):
+    """Extract the articles of the clusters [first, first+len(starts)-1).
+
+    Return the (number of extracted articles, number of errors).
+    """
+    extracted = errors = 0
+    for i in range(len(starts) - 1):
+        cluster_indexes = indexes[starts[i] - starts[0] : starts[i + 1] - starts[0]]
+        if not cluster_indexes:
+            continue
+        dirents = []
+        for index in cluster_indexes:
+            try:
+                dirents.append(archive.get_dirent(index))
+            except UnicodeDecodeError:
+                # No file name for a url which is not utf-8.
+                errors += 1
+        dirents.sort(key=attrgetter("blobNumber"))
+        cluster = Cluster(archive.buf, archive.clusterPtrList[first + i])
+        for dirent in dirents:
+            try:
+                _write_file(
+                    entry_path(outdir, dirent), cluster.get_blob_data(dirent.blobNumber)
+                )
+            except OSError:
+                # Mostly a url being both a file and a directory.
+                errors += 1
+            else:
+                extracted += 1
+    return extracted, errors
+
+
+_worker_archive = None
+
+
+def _init_worker(filename):
+    global _worker_archive
+    _worker_archive = Archive.open(filename)
+
+
+def _extract_task(outdir, first, starts, indexes):
+    return _extract_clusters(
+        _worker_archive, outdir, first, array("I", starts), array("I", indexes)
+    )
+
+
+def _extract_redirects(archive, outdir, redirects):
+    extracted = errors = 0
+    for index in range(archive.articleCount):
+        # Lazy: the url is only decoded for the redirects.
+        dirent = Dirent(archive.buf, archive.urlPtrList[index])
+        if dirent.kind != "redirect":
+            continue
+        try:
+            path = entry_path(outdir, dirent)
+            target_path = entry_path(outdir, archive.get_dirent(dirent.redirect_index))
+            target = os.path.relpath(target_path, os.path.dirname(path))
+            if redirects == "symlink":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.lexists(path):
+                    os.unlink(path)
+                os.symlink(target, path)
+            else:
+                url = html.escape(quote(target.replace(os.sep, "/")))
+                _write_file(path, _STUB.format(url=url).encode())
+        except (OSError, IndexError, UnicodeDecodeError):
+            errors += 1
+        else:
+            extracted += 1
+    return extracted, errors
+
+
+def extract(
+    filename,
+    outdir,
+    workers=None,
+    redirects="symlink",
+    resume=True,
+    progress=None,
+    clusters_per_task=16,
+):
+    """Extract all the entries of the zim file `filename` in `outdir`.
+
+    Articles are extracted by `workers` processes (all the cpus if None),
+    each one handling ranges of `clusters_per_task` clusters with its own
+    mapping of the file. `redirects` may be "symlink", "stub" (a html page
+    redirecting to the target) or "skip".
+    Finished tasks are recorded in `outdir`, so with `resume` an interrupted
+    extraction restarts where it stopped.
+    `progress(done, total)` is called each time a task is finished.
+
+    Return a dict with the number of extracted entries and of errors.
+    """
+    if redirects not in ("symlink", "stub", "skip"):
+        raise ValueError("Invalid redirects mode {!r}".format(redirects))
+    os.makedirs(outdir, exist_ok=True)
+    state_path = os.path.join(outdir, STATE_FILE)
+    done_tasks = set()
+    if resume and os.path.exists(state_path):
+        with open(state_path) as f:
+            done_tasks = set(line.strip() for line in f)
+    workers = workers or os.cpu_count() or 1
+
+    summary = {"articles": 0, "redirects": 0, "errors": 0}
+    with Archive.open(filename) as archive, open(
+        state_path, "a" if resume else "w"
+    ) as state:
+        starts, indexes = archive.cluster_order()
+        total = starts[-1]
+        done = 0
+        tasks = []
+        for first in range(0, archive.clusterCount, clusters_per_task):
+            last = min(first + clusters_per_task, archive.clusterCount)
+            if "{} {}".format(first, last) in done_tasks:
+                done += starts[last] - starts[first]
+                continue
+            task_indexes = indexes[starts[first] : starts[last]]
+            tasks.append((first, starts[first : last + 1], task_indexes))
+
+        def task_done(first, nb_clusters, result):
+            nonlocal done
+            extracted, errors = result
+            summary["articles"] += extracted
+            summary["errors"] += errors
+            state.write("{} {}\n".format(first, first + nb_clusters))
+            state.flush()
+            done += extracted + errors
+            if progress is not None:
+                progress(done, total)
+
+        if workers == 1:
+            for first, task_starts, task_indexes in tasks:
+                result = _extract_clusters(
+                    archive, outdir, first, task_starts, task_indexes
+                )
+                task_done(first, len(task_starts) - 1, result)
+        else:
+            with ProcessPoolExecutor(
+                workers, initializer=_init_worker, initargs=(filename,)
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        _extract_task,
+                        outdir,
+                        first,
+                        task_starts.tobytes(),
+                        task_indexes.tobytes(),
+                    ): (first, len(task_starts) - 1)
+                    for first, task_starts, task_indexes in tasks
+                }
+                for future in as_completed(futures):
+                    task_done(*futures[future], future.result())
+
+        if redirects != "skip" and "redirects" not in done_tasks:
+            extracted, errors = _extract_redirects(archive, outdir, redirects)
+            summary["redirects"] += extracted
+            summary["errors"] += errors
+            state.write("redirects\n")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract a zim file in a directory.")
+    parser.add_argument("zimfile")
+    parser.add_argument("outdir")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes."
+    )
+    parser.add_argument(
+        "--redirects", choices=["symlink", "stub", "skip"], default="symlink"
+    )
+    parser.add_argument(
+        "--no-resume", dest="resume", action="store_false", help="Restart from scratch."
+    )
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print("\r{}/{}".format(done, total), end="", file=sys.stderr, flush=True)
+
+    summary = extract(
+        args.zimfile,
+        args.outdir,
+        workers=args.workers,
+        redirects=args.redirects,
+        resume=args.resume,
+        progress=progress,
+    )
+    print(file=sys.stderr)
+    print(
+        "{articles} articles, {redirects} redirects, {errors} errors".format(**summary)
+    )
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Opt-in instrumentation of the hot paths.
+
+When enabled, the readers record:
+
+- `cluster_decompress_seconds` and `cluster_decompress_bytes` (label
+  `compression`) for each decompression step of a cluster,
+- `dirent_decodes` for each dirent decoded,
+- `lookup_probes` (label `order`, "url" or "title") with the number of
+  dirents compared by each binary search,
+- `buffer_bytes_read` (label `source`) with the bytes read from the archive
+  buffer: compressed input, uncompressed blobs and dirents.
+
+Each measure is passed to the sinks, callables taking (name, value, labels).
+The instrumented code only checks the module level `enabled` flag when
+disabled.
+"""
+
+import math
+import os
+import tempfile
+import threading
+
+__all__ = ["HistogramSink", "PrometheusSink"]
+
+
+enabled = False
+_sinks = []
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# mkstemp creates files only readable by their owner, the collector may not
+# be.
+_FILE_MODE = 0o666 & ~_umask()
+
+
+def enable(*sinks):
+    """Add `sinks` and start recording."""
+    global enabled
+    _sinks.extend(sinks)
+    enabled = bool(_sinks)
+
+
+def disable():
+    """Stop recording and remove all the sinks."""
+    global enabled
+    enabled = False
+    del _sinks[:]
+
+
+def record(name, value, **labels):
+    for sink in _sinks:
+        sink(name, value, labels)
+
+
+class _Histogram:
+    __slots__ = ("count", "sum", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.min = math.inf
+        self.max = -math.inf
+        # Power of two upper bound exponent -> count.
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        exponent = math.frexp(value)[1] if value > 0 else None
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def cumulative_buckets(self):
+        """Yield (upper bound, cumulative count) in increasing order."""
+        total = self.buckets.get(None, 0)
+        if total:
+            yield 0, total
+        for exponent in sorted(e for e in self.buckets if e is not None):
+            total += self.buckets[exponent]
+            yield 2.0**exponent, total
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum / self.count,
+        }
+
+
+class HistogramSink:
+    """Aggregate the measures in memory, in power of two buckets."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def __call__(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.add(value)
+
+    def snapshot(self):
+        """Return {(name, labels): {count, sum, min, max, mean}}, labels being
+        a sorted tuple of (label, value)."""
+        with self._lock:
+            return {key: h.as_dict() for key, h in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+class PrometheusSink(HistogramSink):
+    """A HistogramSink which can be dumped in the Prometheus text format."""
+
+    def __init__(self, prefix="pyzim_"):
+        super().__init__()
+        self.prefix = prefix
+
+    @staticmethod
+    def _labels(labels, **extra):
+        items = list(labels) + list(extra.items())
+        if not items:
+            return ""
+        return "{{{}}}".format(
+            ",".join(
+                '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                for k, v in items
+            )
+        )
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            previous = None
+            for (name, labels), histogram in items:
+                name = self.prefix + name
+                if name != previous:
+                    lines.append("# TYPE {} histogram".format(name))
+                    previous = name
+                for bound, count in histogram.cumulative_buckets():
+                    lines.append(
+                        "{}_bucket{} {}".format(
+                            name, self._labels(labels, le=repr(float(bound))), count
+                        )
+                    )
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        name, self._labels(labels, le="+Inf"), histogram.count
+                    )
+                )
+                lines.append(
+                    "{}_sum{} {!r}".format(name, self._labels(labels), histogram.sum)
+                )
+                lines.append(
+                    "{}_count{} {}".format(name, self._labels(labels), histogram.count)
+                )
+        return "".join(line + "\n" for line in lines)
+
+    def write(self, path):
+        """Write the metrics in `path` atomically (for a textfile collector)."""
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.fspath(path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.chmod(tmp_path, _FILE_MODE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
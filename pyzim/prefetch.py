@@ -0,0 +1,117 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import bisect
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .structs import Cluster
+
+__all__ = ["ClusterPrefetcher"]
+
+
+def _load_cluster(buf, offset):
+    cluster = Cluster(buf, offset)
+    if cluster.compressed:
+        cluster.data
+    return cluster
+
+
+class ClusterPrefetcher:
+    """Iterate on decompressed clusters, reading and decompressing ahead.
+
+    Yield `(number, cluster)` for the cluster numbers `numbers`, in order.
+    While a cluster is consumed, the next `depth` ones are decompressed by
+    `workers` threads (lzma and zstd release the GIL) and, on a mapped file,
+    the kernel is asked to read the `depth` following ones
+    (MADV_WILLNEED). At most `depth` decompressed clusters wait for the
+    consumer, decompression stops when they are not consumed.
+
+    The clusters are read outside of the archive cluster cache.
+    """
+
+    def __init__(self, archive, numbers=None, depth=4, workers=None):
+        self.archive = archive
+        if numbers is None:
+            numbers = range(archive.clusterCount)
+        self.numbers = numbers
+        self.depth = max(1, depth)
+        if workers is None:
+            workers = min(self.depth, os.cpu_count() or 1)
+        self.workers = workers
+        self._bounds = None
+
+    def _cluster_end(self, offset):
+        """An upper bound of the end of the cluster at `offset`: the start of
+        the next cluster or structure of the archive."""
+        if self._bounds is None:
+            header = self.archive.header
+            bounds = set(self.archive.clusterPtrList)
+            bounds.update(
+                (
+                    header.mimeListPos,
+                    header.urlPtrPos,
+                    header.titlePtrPos,
+                    header.clusterPtrPos,
+                    len(self.archive.buf),
+                )
+            )
+            self._bounds = sorted(bounds)
+        index = bisect.bisect_right(self._bounds, offset)
+        if index == len(self._bounds):
+            return len(self.archive.buf)
+        return self._bounds[index]
+
+    def _will_need(self, number):
+        buf = self.archive.buf
+        if not isinstance(buf, mmap.mmap) or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        offset = self.archive.clusterPtrList[number]
+        start = offset - offset % mmap.PAGESIZE
+        end = self._cluster_end(offset)
+        if end > start:
+            buf.madvise(mmap.MADV_WILLNEED, start, end - start)
+
+    def __iter__(self):
+        buf = self.archive.buf
+        clusterPtrList = self.archive.clusterPtrList
+        numbers = list(self.numbers)
+        pending = deque()
+        executor = ThreadPoolExecutor(self.workers)
+        try:
+            for number in numbers[: 2 * self.depth]:
+                self._will_need(number)
+            for position, number in enumerate(numbers):
+                while len(pending) < self.depth and position + len(pending) < len(
+                    numbers
+                ):
+                    ahead = position + len(pending)
+                    pending.append(
+                        executor.submit(
+                            _load_cluster, buf, clusterPtrList[numbers[ahead]]
+                        )
+                    )
+                    if ahead + 2 * self.depth < len(numbers):
+                        self._will_need(numbers[ahead + 2 * self.depth])
+                cluster = pending.popleft().result()
+                yield number, cluster
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -0,0 +1,193 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from .buffers import PreadBuffer
+from .structs import CTYPES, numpy, unpack_from
+from .urlindex import _FILE_MODE, archive_id
+
+__all__ = ["RedirectTable", "REDIRECT_LOOP", "REDIRECT_DANGLING"]
+
+
+# Values of the table for entries which don't end on an article.
+REDIRECT_LOOP = 0xFFFFFFFF
+REDIRECT_DANGLING = 0xFFFFFFFE
+
+# A saved table is a header (magic, version, number of entries, zim uuid and
+# checksum) followed by the table as little endian uint32.
+MAGIC = b"PYZIMRDR"
+VERSION = 1
+TABLE_HEADER = struct.Struct("<8sII16s16s")
+
+SUFFIX = ".redirects"
+
+_UINT16 = CTYPES["c_uint16"]
+_UINT32 = CTYPES["c_uint32"]
+
+
+def _build_python(archive):
+    count = archive.articleCount
+    buf = archive.buf
+    table = array("I", range(count))
+    # 1 for redirects still to resolve, 2 for the ones on the current chain.
+    pending = bytearray(count)
+    for index, offset in enumerate(archive.urlPtrList):
+        mimetype = unpack_from(_UINT16, buf, offset)[0]
+        if mimetype == 0xFFFF:
+            table[index] = unpack_from(_UINT32, buf, offset + 8)[0]
+            pending[index] = 1
+        elif mimetype >= 0xFFFD:
+            table[index] = REDIRECT_DANGLING
+
+    for index in range(count):
+        if not pending[index]:
+            continue
+        chain = []
+        target = index
+        while target < count and pending[target] == 1:
+            pending[target] = 2
+            chain.append(target)
+            target = table[target]
+        if target >= count:
+            final = REDIRECT_DANGLING
+        elif pending[target] == 2:
+            final = REDIRECT_LOOP
+        else:
+            final = table[target]
+        for redirect in chain:
+            table[redirect] = final
+            pending[redirect] = 0
+    return table
+
+
+def _build_numpy(archive):
+    count = archive.articleCount
+    raw = numpy.frombuffer(archive.buf, dtype=numpy.uint8)
+    offsets = archive.urlPtrList.as_numpy().astype(numpy.int64)
+
+    def gather_uint(offsets, size):
+        value = numpy.zeros(len(offsets), dtype=numpy.int64)
+        for i in range(size):
+            value |= raw[offsets + i].astype(numpy.int64) << (8 * i)
+        return value
+
+    mimetypes = gather_uint(offsets, 2)
+    is_redirect = mimetypes == 0xFFFF
+    # An extra `sink` entry (index `count`) collects dangling redirects.
+    is_article = numpy.append(mimetypes < 0xFFFD, False)
+    sink = count
+    targets = gather_uint(offsets[is_redirect] + 8, 4)
+    targets[targets >= count] = sink
+    following = numpy.arange(count + 1, dtype=numpy.int64)
+    following[:count][~is_article[:count]] = sink
+    following[:count][is_redirect] = targets
+
+    # Pointer jumping: after n rounds, following[i] is 2**n hops after i.
+    # Chains longer than the number of entries are loops.
+    for _ in range(count.bit_length() + 1):
+        following = following[following]
+
+    table = numpy.where(
+        is_article[following],
+        following,
+        numpy.where(following == sink, REDIRECT_DANGLING, REDIRECT_LOOP),
+    )[:count]
+    return array("I", table.astype("<u4").tobytes())
+
+
+class RedirectTable:
+    """The index of the article each entry finally leads to.
+
+    Articles map to themselves and redirects to the article at the end of the
+    redirect chain, or to `REDIRECT_LOOP` / `REDIRECT_DANGLING` if the chain
+    loops or ends out of range or on a link/deleted entry.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def build(cls, archive):
+        """Build the table in one pass on the dirents.
+
+        With numpy, the fields are gathered and the chains resolved (by
+        pointer jumping) with vectorized operations (if the archive buffer
+        supports the buffer protocol).
+        """
+        if (
+            numpy is not None
+            and sys.byteorder == "little"
+            and not isinstance(archive.buf, PreadBuffer)
+        ):
+            return cls(_build_numpy(archive))
+        return cls(_build_python(archive))
+
+    @classmethod
+    def load(cls, path, header):
+        """Load a table saved for the archive of `header`.
+
+        Raise a ValueError if the file is not the table of this archive.
+        """
+        with open(path, "rb") as f:
+            content = f.read()
+        try:
+            magic, version, count, uuid, checksum = TABLE_HEADER.unpack_from(content)
+        except struct.error:
+            raise ValueError("{} is not a redirect table".format(path))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a redirect table".format(path))
+        if (uuid, checksum) != archive_id(header) or count != header.articleCount:
+            raise ValueError("{} is the table of another archive".format(path))
+        table = array("I")
+        table.frombytes(content[TABLE_HEADER.size :])
+        if len(table) != count:
+            raise ValueError("{} is truncated".format(path))
+        if sys.byteorder != "little":
+            table.byteswap()
+        return cls(table)
+
+    def save(self, path, header):
+        table = self.table
+        if sys.byteorder != "little":
+            table = array("I", table)
+            table.byteswap()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(
+                    TABLE_HEADER.pack(MAGIC, VERSION, len(table), *archive_id(header))
+                )
+                table.tofile(f)
+            os.chmod(tmp_path, _FILE_MODE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, index):
+        return self.table[index]
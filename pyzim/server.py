@@ -0,0 +1,208 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import os
+import re
+import sys
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+from .archive import Archive
+
+__all__ = ["ZimHTTPServer", "ZimRequestHandler"]
+
+
+MAX_REDIRECTS = 32
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(value, size):
+    """Parse a (single) Range header value.
+
+    Return (start, end) (end excluded), None if the header is not a single
+    bytes range (it must then be ignored) or raise ValueError if the range
+    cannot be satisfied.
+    """
+    match = _RANGE_RE.match(value.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        # Suffix range: the last `end` bytes.
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError(value)
+        return max(0, size - length), size
+    start = int(start)
+    if end and int(end) < start:
+        # Invalid range-spec: the header is ignored.
+        return None
+    if start >= size:
+        raise ValueError(value)
+    end = size if not end else min(int(end) + 1, size)
+    return start, end
+
+
+class ZimRequestHandler(BaseHTTPRequestHandler):
+    """Serve the entries of `server.archive` at /<namespace>/<url>."""
+
+    def do_GET(self):
+        self.handle_entry(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_entry(send_body=False)
+
+    def _resolve(self, path):
+        """Return the (index, dirent) of an article, or an url to redirect to."""
+        archive = self.server.archive
+        path = unquote(urlsplit(path).path)
+        if path == "/":
+            mainPage = archive.header.mainPage
+            if mainPage == 0xFFFFFFFF:
+                raise IndexError(path)
+            return self._entry_url(archive.get_dirent(mainPage))
+        ns, _, url = path[1:].partition("/")
+        if len(ns.encode()) != 1:
+            raise IndexError(path)
+        index = archive.find_by_url(ns, url)
+        dirent = archive.get_dirent(index)
+        if dirent.kind == "article":
+            return index, dirent
+        for _ in range(MAX_REDIRECTS):
+            if dirent.kind != "redirect":
+                raise IndexError(path)
+            dirent = archive.get_dirent(dirent.redirect_index)
+            if dirent.kind == "article":
+                return self._entry_url(dirent)
+        raise IndexError(path)
+
+    @staticmethod
+    def _entry_url(dirent):
+        return "/{}/{}".format(dirent.namespace.decode(), quote(dirent.url))
+
+    def handle_entry(self, send_body):
+        archive = self.server.archive
+        try:
+            resolved = self._resolve(self.path)
+            if isinstance(resolved, str):
+                self.send_response(HTTPStatus.FOUND)
+                self.send_header("Location", resolved)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            index, dirent = resolved
+            cluster = archive.get_cluster(dirent.clusterNumber)
+            if cluster.compressed:
+                blob = archive.get_blob_view(dirent)
+                size = len(blob)
+            else:
+                blob = None
+                start = cluster.get_blob_offset(dirent.blobNumber)
+                size = cluster.get_blob_offset(dirent.blobNumber + 1) - start
+                file_offset = cluster.offset + 1 + start
+            mimetype = archive.get_mimetype(dirent)
+        except IndexError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        etag = '"{}-{}"'.format(archive.header.uuid.hex(), index)
+        if etag in (self.headers.get("If-None-Match") or ""):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        begin, end = 0, size
+        status = HTTPStatus.OK
+        range_header = self.headers.get("Range")
+        if range_header is not None:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range is not None:
+                begin, end = byte_range
+                status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_header("Content-Type", mimetype)
+        self.send_header("Content-Length", str(end - begin))
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header(
+                "Content-Range", "bytes {}-{}/{}".format(begin, end - 1, size)
+            )
+        self.end_headers()
+        if not send_body:
+            return
+        if blob is not None:
+            self.wfile.write(blob[begin:end])
+        elif archive.fileno() is not None and hasattr(os, "sendfile"):
+            self.wfile.flush()
+            self._sendfile(archive.fileno(), file_offset + begin, end - begin)
+        else:
+            self.wfile.write(archive.buf[file_offset + begin : file_offset + end])
+
+    def _sendfile(self, fileno, offset, count):
+        """Send the file content straight from the page cache."""
+        socket_fileno = self.connection.fileno()
+        while count > 0:
+            sent = os.sendfile(socket_fileno, fileno, offset, count)
+            if sent == 0:
+                break
+            offset += sent
+            count -= sent
+
+
+class ZimHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, archive, handler=ZimRequestHandler):
+        super().__init__(server_address, handler)
+        # The Archive is thread safe, requests are served in parallel.
+        self.archive = archive
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the content of a zim file.")
+    parser.add_argument("zimfile")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    with Archive.open(args.zimfile) as archive:
+        with ZimHTTPServer((args.host, args.port), archive) as server:
+            print("Serving on http://{}:{}/".format(*server.server_address[:2]))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
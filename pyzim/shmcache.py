@@ -0,0 +1,243 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+__all__ = ["SharedClusterCache"]
+
+
+# The segment starts with a header (magic, version, number of slots, size of
+# the data ring and its head), followed by the slots and the data ring.
+MAGIC = b"PYZIMSHM"
+VERSION = 1
+SEGMENT_HEADER = struct.Struct("<8sIIQQ")
+_HEAD_OFFSET = 24
+_HEAD = struct.Struct("<Q")
+
+# A slot is (sequence, uuid, cluster number, unused, start, size). `start` is
+# the position of the data in the ring, counted since its creation (it never
+# wraps, the data being at `start % data_size`).
+SLOT = struct.Struct("<Q16sIIQQ")
+_SEQUENCE = struct.Struct("<Q")
+
+# Number of slots where a key may be stored.
+PROBES = 8
+
+DEFAULT_NAME = "pyzim-clusters"
+DEFAULT_SIZE = 256 * 1024 * 1024
+
+
+def _open_segment(name, create=False, size=0):
+    # The segment must outlive the process which creates it (the pre-forking
+    # master for instance), so it is not tracked.
+    try:
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name, create, size)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class SharedClusterCache:
+    """A cache of decompressed clusters shared by processes of a host.
+
+    The cache is a shared memory segment `name` of `size` bytes, created by
+    the first process using it and kept until `unlink` is called. Clusters
+    are keyed by (archive uuid, cluster number) and their data is stored in a
+    ring buffer: the oldest clusters are overwritten first.
+
+    Readers don't take any lock: the slots are protected by a sequence
+    number (odd while a slot is written) and a read is valid if the sequence
+    didn't change and the ring head didn't pass over the data while it was
+    copied. Writers are serialized by a lock file (so this is POSIX only).
+    """
+
+    def __init__(self, name=DEFAULT_NAME, size=DEFAULT_SIZE, nb_slots=None):
+        if fcntl is None:
+            raise RuntimeError("SharedClusterCache needs fcntl (POSIX)")
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._thread_lock = threading.Lock()
+        self._lock_path = os.path.join(
+            tempfile.gettempdir(), "{}.lock".format(name.lstrip("/"))
+        )
+        self._lock_file = open(self._lock_path, "a+b")
+        try:
+            with self._write_lock():
+                self._segment = self._open(size, nb_slots)
+        except BaseException:
+            self._lock_file.close()
+            raise
+        self.buf = self._segment.buf
+        (_magic, _version, self.nb_slots, self.data_size, _head) = (
+            SEGMENT_HEADER.unpack_from(self.buf)
+        )
+        self._data_offset = SEGMENT_HEADER.size + self.nb_slots * SLOT.size
+
+    def _open(self, size, nb_slots):
+        try:
+            segment = _open_segment(self.name)
+        except FileNotFoundError:
+            pass
+        else:
+            magic, version = SEGMENT_HEADER.unpack_from(segment.buf)[:2]
+            if (magic, version) != (MAGIC, VERSION):
+                segment.close()
+                raise ValueError("{} is not a cluster cache".format(self.name))
+            return segment
+
+        if nb_slots is None:
+            # Room for clusters of 64KiB on average.
+            nb_slots = max(PROBES, size // (64 * 1024))
+        data_size = size - SEGMENT_HEADER.size - nb_slots * SLOT.size
+        if data_size <= 0:
+            raise ValueError("Cache size {} is too small".format(size))
+        segment = _open_segment(self.name, create=True, size=size)
+        # A new segment is zero filled: all slots are empty.
+        SEGMENT_HEADER.pack_into(segment.buf, 0, MAGIC, VERSION, nb_slots, data_size, 0)
+        return segment
+
+    @contextmanager
+    def _write_lock(self):
+        # flock excludes other processes, not the threads sharing the file.
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        self.buf = None
+        self._segment.close()
+        self._lock_file.close()
+
+    def unlink(self):
+        """Remove the segment, once the processes using it are done."""
+        if not hasattr(self._segment, "_track"):
+            # Before Python 3.13, unlink unregisters the segment we didn't
+            # leave registered.
+            resource_tracker.register(self._segment._name, "shared_memory")
+        self._segment.unlink()
+        try:
+            os.unlink(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _slots(self, uuid, number):
+        digest = hashlib.blake2b(
+            uuid + number.to_bytes(4, "little"), digest_size=8
+        ).digest()
+        first = int.from_bytes(digest, "little") % self.nb_slots
+        for probe in range(min(PROBES, self.nb_slots)):
+            yield SEGMENT_HEADER.size + ((first + probe) % self.nb_slots) * SLOT.size
+
+    def _head(self):
+        return _HEAD.unpack_from(self.buf, _HEAD_OFFSET)[0]
+
+    def _is_live(self, start, head):
+        """Whether the data at `start` has not been overwritten."""
+        return head - start <= self.data_size
+
+    def get(self, uuid, number):
+        """Return a copy of the data of the cluster, or None."""
+        buf = self.buf
+        for slot in self._slots(uuid, number):
+            sequence, slot_uuid, slot_number, _, start, size = SLOT.unpack_from(buf, slot)
+            if sequence & 1 or sequence == 0:
+                continue
+            if slot_uuid != uuid or slot_number != number:
+                continue
+            if not self._is_live(start, self._head()):
+                break
+            position = self._data_offset + start % self.data_size
+            data = bytes(buf[position : position + size])
+            if (
+                _SEQUENCE.unpack_from(buf, slot)[0] == sequence
+                and self._is_live(start, self._head())
+            ):
+                self.hits += 1
+                return data
+            break
+        self.misses += 1
+        return None
+
+    def put(self, uuid, number, data):
+        """Store the data of a cluster, overwriting the oldest ones if
+        needed. Return whether the data has been stored."""
+        size = len(data)
+        if size > self.data_size:
+            return False
+        buf = self.buf
+        with self._write_lock():
+            head = self._head()
+            chosen = oldest = None
+            for slot in self._slots(uuid, number):
+                sequence, slot_uuid, slot_number, _, start, _size = (
+                    SLOT.unpack_from(buf, slot)
+                )
+                live = sequence != 0 and self._is_live(start, head)
+                if live and (slot_uuid, slot_number) == (uuid, number):
+                    # Another process stored it first.
+                    return True
+                if not live:
+                    chosen = chosen or slot
+                elif oldest is None or start < oldest[1]:
+                    oldest = (slot, start)
+            if chosen is None:
+                chosen = oldest[0]
+
+            start = head
+            if start % self.data_size + size > self.data_size:
+                # The data is contiguous, skip the end of the ring.
+                start += self.data_size - start % self.data_size
+            sequence = _SEQUENCE.unpack_from(buf, chosen)[0]
+            _SEQUENCE.pack_into(buf, chosen, sequence + 1)
+            # Move the head first: readers of the data we overwrite see it.
+            _HEAD.pack_into(buf, _HEAD_OFFSET, start + size)
+            position = self._data_offset + start % self.data_size
+            buf[position : position + size] = data
+            SLOT.pack_into(buf, chosen, sequence + 1, uuid, number, 0, start, size)
+            _SEQUENCE.pack_into(buf, chosen, sequence + 2)
+        return True
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "slots": self.nb_slots,
+            "data_size": self.data_size,
+        }
@@ -15,9 +15,30 @@
 # along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import functools
+import io
+import operator
 import struct
+import sys
+import threading
+import time
 from lzma import LZMADecompressor, FORMAT_XZ
 
+try:
+    from compression.zstd import ZstdDecompressor
+except ImportError:
+    try:
+        from pyzstd import ZstdDecompressor
+    except ImportError:
+        ZstdDecompressor = None
+
+from . import metrics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 CTYPES = {}
 for t in (
     ("c_uint8", "B"),
@@ -37,10 +58,21 @@ __all__ = [
     "ClusterPtrList",
     "Header",
     "Dirent",
+    "DirentRecord",
     "Cluster",
+    "BlobReader",
 ]
 
 
+def unpack_from(struct_, buf, offset=0):
+    """`struct_.unpack_from`, also working on buffers which don't implement
+    the buffer protocol (as `buffers.PreadBuffer`)."""
+    try:
+        return struct_.unpack_from(buf, offset)
+    except TypeError:
+        return struct_.unpack(buf[offset : offset + struct_.size])
+
+
 class AttributeDescriptor:
     def __init__(self, offset, ctype):
         self.offset = offset
@@ -50,13 +82,14 @@ class AttributeDescriptor:
             self.ctype = struct.Struct("<" + ctype)
 
     def __get__(self, obj, objtype):
-        return self.ctype.unpack_from(obj.buf, obj.offset + self.offset)[0]
+        return unpack_from(self.ctype, obj.buf, obj.offset + self.offset)[0]
 
 
 class MetaBaseStruct(type):
     def __new__(cls, name, bases, attrs):
         fields = attrs.get("_fields_", [])
         offset = 0
+        formats = []
         for field in fields:
             if len(field) == 3:
                 name_, ctype, size = field
@@ -64,35 +97,80 @@ class MetaBaseStruct(type):
                 name_, ctype = field
                 size = None
             attrs[name_] = AttributeDescriptor(offset, ctype)
+            field_ctype = attrs[name_].ctype
             if size is None:
-                size = attrs[name_].ctype.size
+                size = field_ctype.size
+            formats.append(field_ctype.format[1:] + "x" * (size - field_ctype.size))
             offset += size
         attrs["csize"] = offset
+        # All the fields in one struct, to unpack them at once.
+        attrs["_names_"] = tuple(field[0] for field in fields)
+        attrs["_struct_"] = struct.Struct("<" + "".join(formats))
 
         return super().__new__(cls, name, bases, attrs)
 
 
 class MimetypeList:
+    """The mimetypes of an archive.
+
+    The list is parsed once, on first access, into the offsets of the
+    mimetypes in the buffer and the decoded strings.
+    """
+
     def __init__(self, buf, offset):
         self.buf = buf
         self.offset = offset
-
-    def __getitem__(self, index):
+        self._offsets = None
+        self._mimetypes = None
+        self._indexes = None
+
+    def _parse(self):
+        buf = self.buf
+        offsets = []
+        mimetypes = []
         off = self.offset
-        for i in range(index):
-            end_off = self.buf.find(bytes([0]), off)
-            if end_off == off:
-                # empty string, end of the mimelist.
-                raise IndexError
+        while True:
+            end_off = buf.find(bytes([0]), off)
+            if end_off <= off:
+                # empty string (or no terminator), end of the mimelist.
+                break
+            offsets.append(off)
+            mimetypes.append(buf[off:end_off].decode("ascii"))
             off = end_off + 1
-        end_off = self.buf.find(bytes([0]), off)
-        if end_off == off:
-            raise IndexError
-        return self.buf[off:end_off].decode("ascii")
+        self._offsets = offsets
+        self._mimetypes = mimetypes
+        self._indexes = {m: i for i, m in reversed(list(enumerate(mimetypes)))}
+
+    @property
+    def offsets(self):
+        """The offsets of the mimetypes in the buffer."""
+        if self._offsets is None:
+            self._parse()
+        return self._offsets
+
+    def __getitem__(self, index):
+        if self._mimetypes is None:
+            self._parse()
+        return self._mimetypes[index]
 
     def __len__(self):
-        end_buf = self.buf.find(bytes([0, 0]), self.offset)
-        return self.buf.count(bytes([0]), self.offset, end_buf + 1)
+        if self._mimetypes is None:
+            self._parse()
+        return len(self._mimetypes)
+
+    def __iter__(self):
+        if self._mimetypes is None:
+            self._parse()
+        return iter(self._mimetypes)
+
+    def index(self, mimetype):
+        """Return the index of `mimetype`, or raise ValueError."""
+        if self._indexes is None:
+            self._parse()
+        try:
+            return self._indexes[mimetype]
+        except KeyError:
+            raise ValueError("{!r} is not in the mimetype list".format(mimetype))
 
 
 class BaseStruct(metaclass=MetaBaseStruct):
@@ -100,19 +178,107 @@ class BaseStruct(metaclass=MetaBaseStruct):
         self.buf = buf
         self.offset = offset
 
+    def _unpack_fields(self, struct_=None):
+        """Unpack the fields once and store them on the instance.
+
+        The instance attributes shadow the (non data) field descriptors.
+        `struct_` may unpack only the first fields.
+        """
+        struct_ = struct_ or self._struct_
+        values = unpack_from(struct_, self.buf, self.offset)
+        self.__dict__.update(zip(self._names_, values))
+
 
 class BaseArray:
-    def __init__(self, buf, offset):
+    """An array of little endian integers in `buf`, starting at `offset`.
+
+    If `count` is given, the array is sized and (on little endian hosts)
+    backed by a memoryview cast on the buffer. Slicing is then zero-copy and
+    iteration doesn't go through `struct` for each item.
+    Without `count`, items are unpacked on demand, which allows arrays on a
+    buffer still growing (as the decompressed data of a cluster).
+    """
+
+    def __init__(self, buf, offset, count=None):
         self.buf = buf
         self.offset = offset
+        self.count = count
+        self._view = None
+        if count is not None and sys.byteorder == "little":
+            self._view = self._cast_view()
+
+    def _cast_view(self):
+        size = self.ctype.size
+        try:
+            view = memoryview(self.buf)
+        except TypeError:
+            return None
+        view = view[self.offset : self.offset + self.count * size]
+        if len(view) != self.count * size:
+            # Truncated buffer, let the struct path raise IndexError.
+            return None
+        return view.cast(self.ctype.format[-1])
+
+    def release(self):
+        """Release the view on the buffer (needed before closing a mmap)."""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+    def __len__(self):
+        if self.count is None:
+            return max(0, (len(self.buf) - self.offset) // self.ctype.size)
+        return self.count
+
+    def __iter__(self):
+        if self._view is not None:
+            return iter(self._view)
+        return (self[i] for i in range(len(self)))
 
     def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return type(self)(
+                self.buf, self.offset + start * self.ctype.size, max(0, stop - start)
+            )
+        try:
+            index = operator.index(index)
+        except TypeError:
+            return self._gather(index)
+        if self._view is not None:
+            return self._view[index]
+        if self.count is not None:
+            if index < 0:
+                index += self.count
+            if not 0 <= index < self.count:
+                raise IndexError
         offset = self.offset + index * self.ctype.size
         try:
-            return self.ctype.unpack_from(self.buf, offset)[0]
+            return unpack_from(self.ctype, self.buf, offset)[0]
         except struct.error:
             raise IndexError
 
+    def _gather(self, indexes):
+        if numpy is not None and isinstance(indexes, numpy.ndarray):
+            return self.as_numpy()[indexes]
+        return [self[i] for i in indexes]
+
+    def as_numpy(self):
+        """Return the array as a (read only if the buffer is) numpy array
+        sharing the buffer memory."""
+        if numpy is None:
+            raise RuntimeError("numpy is not installed")
+        dtype = "<u{}".format(self.ctype.size)
+        try:
+            return numpy.frombuffer(
+                self.buf, dtype=dtype, count=len(self), offset=self.offset
+            )
+        except TypeError:
+            end = self.offset + len(self) * self.ctype.size
+            return numpy.frombuffer(self.buf[self.offset : end], dtype=dtype)
+
 
 class UrlPtrList(BaseArray):
     ctype = CTYPES["c_uint64"]
@@ -143,10 +309,22 @@ class Header(BaseStruct):
         ("_checksumPos", "c_uint64"),
     ]
 
+    def __init__(self, buf, offset):
+        super().__init__(buf, offset)
+        try:
+            self._unpack_fields()
+        except struct.error:
+            # Old headers stop at mimeListPos == 72, without checksumPos.
+            self._unpack_fields(_HEADER_V0)
+
     @property
     def size(self):
         return self.mimeListPos
 
+    @functools.cached_property
+    def mimetypeList(self):
+        return MimetypeList(self.buf, self.mimeListPos)
+
     @property
     def checksumPos(self):
         if self.mimeListPos < 80:
@@ -155,11 +333,15 @@ class Header(BaseStruct):
 
 
 assert Header.csize == 80
+_HEADER_V0 = struct.Struct(Header._struct_.format[:-1])
+assert _HEADER_V0.size == 72
 
 
 class Dirent(BaseStruct):
     def __new__(cls, buf, offset):
-        mimetype = CTYPES["c_uint16"].unpack_from(buf[offset:offset+2])[0]
+        if metrics.enabled:
+            metrics.record("dirent_decodes", 1)
+        mimetype = unpack_from(CTYPES["c_uint16"], buf, offset)[0]
         if mimetype == 0xFFFF:
             return super(Dirent, cls).__new__(RedirectDirent)
         if mimetype in (0xFFFE, 0xFFFD):
@@ -237,6 +419,86 @@ class LinkDeletedDirent(Dirent):
 assert LinkDeletedDirent.csize == 8
 
 
+_DIRENT_COMMON = LinkDeletedDirent._struct_
+_DIRENT_ARTICLE_TAIL = struct.Struct("<II")
+_DIRENT_REDIRECT_TAIL = CTYPES["c_uint32"]
+
+
+def dirent_blob(buf, offset):
+    """Return the (clusterNumber, blobNumber) of the dirent at `offset`,
+    or None if it is not an article."""
+    mimetype = unpack_from(CTYPES["c_uint16"], buf, offset)[0]
+    if mimetype >= 0xFFFD:
+        return None
+    return unpack_from(_DIRENT_ARTICLE_TAIL, buf, offset + 8)
+
+
+class DirentRecord:
+    """A dirent decoded in one pass.
+
+    It has the same attributes than the `Dirent` classes but all the fields,
+    url and title are decoded at creation, scanning the dirent only once.
+    """
+
+    __slots__ = (
+        "buf",
+        "offset",
+        "kind",
+        "mimetype",
+        "parameter_len",
+        "namespace",
+        "revision",
+        "clusterNumber",
+        "blobNumber",
+        "redirect_index",
+        "url",
+        "title",
+        "_extra_offset",
+    )
+
+    def __init__(self, buf, offset):
+        self.buf = buf
+        self.offset = offset
+        (
+            mimetype,
+            self.parameter_len,
+            self.namespace,
+            self.revision,
+        ) = unpack_from(_DIRENT_COMMON, buf, offset)
+        self.mimetype = mimetype
+        if mimetype == 0xFFFF:
+            self.kind = "redirect"
+            (self.redirect_index,) = unpack_from(_DIRENT_REDIRECT_TAIL, buf, offset + 8)
+            off = offset + 12
+        elif mimetype in (0xFFFE, 0xFFFD):
+            self.kind = "link" if mimetype == 0xFFFE else "deleted"
+            off = offset + 8
+        else:
+            self.kind = "article"
+            (
+                self.clusterNumber,
+                self.blobNumber,
+            ) = unpack_from(_DIRENT_ARTICLE_TAIL, buf, offset + 8)
+            off = offset + 16
+        end_off = buf.find(b"\0", off)
+        self.url = buf[off:end_off].decode()
+        off = end_off + 1
+        end_off = buf.find(b"\0", off)
+        self.title = buf[off:end_off].decode()
+        self._extra_offset = end_off + 1
+        if metrics.enabled:
+            metrics.record("dirent_decodes", 1)
+            metrics.record(
+                "buffer_bytes_read",
+                self._extra_offset + self.parameter_len - offset,
+                source="dirent",
+            )
+
+    @property
+    def extra_data(self):
+        return self.buf[self._extra_offset : self._extra_offset + self.parameter_len]
+
+
 class NormalBlobOffsetArray(BaseArray):
     ctype = CTYPES["c_uint32"]
 
@@ -248,11 +510,29 @@ class ExtendedBlobOffsetArray(BaseArray):
 class Cluster(BaseStruct):
     _fields_ = [("info", "c_uint8")]
 
+    # Size of the compressed chunks given to the decompressor.
+    CHUNK_SIZE = 64 * 1024
+
+    COMPRESSION_NAMES = {0: "none", 1: "none", 4: "xz", 5: "zstd"}
+
     def __init__(self, buf, offset):
         super().__init__(buf, offset)
+        # Serializes the decompression and the reads of the decompressed data
+        # (which cannot be resized while a view on it exists).
+        self._lock = threading.RLock()
         self._data = None
+        self._decompressor = None
+        self._input_offset = None
         self._offsetArray = None
 
+    @classmethod
+    def from_decompressed(cls, buf, offset, data):
+        """Create a compressed cluster whose content `data` has already been
+        decompressed (in another thread or process)."""
+        cluster = cls(buf, offset)
+        cluster._data = data
+        return cluster
+
     @property
     def compression(self):
         return self.info & 0b00001111
@@ -262,19 +542,93 @@ class Cluster(BaseStruct):
         return bool(self.info & 0b00010000)
 
     @property
-    def data(self):
+    def compressed(self):
+        return self.compression not in (0, 1)
+
+    def _new_decompressor(self):
         if self.compression == 4:
-            if self._data is None:
-                decompressor = LZMADecompressor(format=FORMAT_XZ)
-                offset = self.offset + 1
-                self._data = b""
-                while decompressor.needs_input:
-                    idata = self.buf[offset:offset+1024]
-                    self._data += decompressor.decompress(idata)
-                    offset += 1024
-            return self._data, 0
+            return LZMADecompressor(format=FORMAT_XZ)
+        if self.compression == 5:
+            if ZstdDecompressor is None:
+                raise RuntimeError(
+                    "Reading zstd clusters needs Python 3.14 or the pyzstd package"
+                )
+            return ZstdDecompressor()
+        raise ValueError("Unsupported cluster compression {}".format(self.compression))
+
+    @property
+    def offset_size(self):
+        return 8 if self.extended else 4
+
+    @property
+    def decompressed_size(self):
+        """The number of bytes decompressed so far."""
+        return 0 if self._data is None else len(self._data)
+
+    @property
+    def fully_decompressed(self):
+        """Whether all the content of a compressed cluster is decompressed."""
+        return self._data is not None and self._decompressor is None
+
+    def _decompress(self, size=None):
+        """Decompress the cluster until `size` bytes are available.
+
+        If `size` is None, decompress the whole cluster.
+        The decompression state is kept so a later call resumes where this one
+        stopped.
+        """
+        if self._data is None:
+            self._data = bytearray()
+            self._decompressor = self._new_decompressor()
+            self._input_offset = self.offset + 1
+        data = self._data
+        timed = metrics.enabled and self._decompressor is not None
+        if timed:
+            start = time.perf_counter()
+            data_size = len(data)
+            input_offset = self._input_offset
+        while self._decompressor is not None and (size is None or len(data) < size):
+            decompressor = self._decompressor
+            if decompressor.needs_input:
+                offset = self._input_offset
+                chunk = self.buf[offset : offset + self.CHUNK_SIZE]
+                if not chunk:
+                    raise EOFError("Compressed cluster is truncated")
+                self._input_offset += len(chunk)
+            else:
+                # The decompressor still has buffered input.
+                chunk = b""
+            max_length = -1 if size is None else size - len(data)
+            data += decompressor.decompress(chunk, max_length)
+            if decompressor.eof:
+                self._decompressor = None
+        if timed:
+            compression = self.COMPRESSION_NAMES.get(self.compression, "unknown")
+            metrics.record(
+                "cluster_decompress_seconds",
+                time.perf_counter() - start,
+                compression=compression,
+            )
+            metrics.record(
+                "cluster_decompress_bytes", len(data) - data_size, compression=compression
+            )
+            metrics.record(
+                "buffer_bytes_read", self._input_offset - input_offset, source="cluster"
+            )
+        return data
+
+    def _get_data(self, size=None):
+        """Return a (buffer, offset) where at least `size` bytes of the
+        (uncompressed) cluster content are available."""
+        if self.compressed:
+            with self._lock:
+                return self._decompress(size), 0
         else:
-            return self.buf, self.offset+1
+            return self.buf, self.offset + 1
+
+    @property
+    def data(self):
+        return self._get_data()
 
     @property
     def offsetArray(self):
@@ -282,7 +636,9 @@ class Cluster(BaseStruct):
             OffsetArrayType = (
                 ExtendedBlobOffsetArray if self.extended else NormalBlobOffsetArray
             )
-            self._offsetArray = OffsetArrayType(*self.data)
+            with self._lock:
+                if self._offsetArray is None:
+                    self._offsetArray = OffsetArrayType(*self._get_data(0))
         return self._offsetArray
 
     @property
@@ -291,17 +647,117 @@ class Cluster(BaseStruct):
 
     @property
     def nb_offsets(self):
+        self._get_data(self.offset_size)
         first_offset = self.offsetArray[0]
-        ctype = CTYPES["c_uint64"] if self.extended else CTYPES["c_uint32"]
-        return first_offset // ctype.size
+        return first_offset // self.offset_size
 
     def get_blob_offset(self, index):
         if index >= self.nb_offsets:
             raise IndexError
+        self._get_data((index + 1) * self.offset_size)
         return self.offsetArray[index]
 
     def get_blob_data(self, index):
         blob_offset = self.get_blob_offset(index)
         end_offset = self.get_blob_offset(index + 1)
-        data, offset = self.data
-        return data[offset+blob_offset:offset+end_offset]
+        if self.compressed:
+            with self._lock:
+                data = self._decompress(end_offset)
+                with memoryview(data) as view:
+                    return bytes(view[blob_offset:end_offset])
+        data, offset = self._get_data(end_offset)
+        if metrics.enabled:
+            metrics.record("buffer_bytes_read", end_offset - blob_offset, source="blob")
+        return data[offset + blob_offset : offset + end_offset]
+
+    def get_blob_view(self, index):
+        """Return the blob content as a memoryview, without copying it.
+
+        The view points in the buffer for uncompressed clusters and in the
+        decompressed data for compressed ones. As the decompressed data cannot
+        grow while a view on it exists, a compressed cluster is fully
+        decompressed first. The blob is copied if the buffer doesn't support
+        the buffer protocol. The view is read only: the decompressed data is
+        shared by all the readers of the cluster.
+        """
+        blob_offset = self.get_blob_offset(index)
+        end_offset = self.get_blob_offset(index + 1)
+        if self.compressed:
+            data, offset = self._get_data()
+        else:
+            data, offset = self._get_data(end_offset)
+            if metrics.enabled:
+                metrics.record(
+                    "buffer_bytes_read", end_offset - blob_offset, source="blob"
+                )
+        try:
+            view = memoryview(data)
+        except TypeError:
+            return memoryview(data[offset + blob_offset : offset + end_offset])
+        return view[offset + blob_offset : offset + end_offset].toreadonly()
+
+    def open_blob(self, index, on_read=None):
+        return BlobReader(self, index, on_read)
+
+
+class BlobReader(io.RawIOBase):
+    """A seekable read-only file object on the content of a blob.
+
+    Compressed clusters are decompressed as the reader advances, so streaming
+    the start of a blob doesn't wait for the whole cluster.
+    `on_read` is called with the cluster after each read.
+    """
+
+    def __init__(self, cluster, index, on_read=None):
+        super().__init__()
+        self.cluster = cluster
+        self.on_read = on_read
+        self._start = cluster.get_blob_offset(index)
+        self._end = cluster.get_blob_offset(index + 1)
+        self._pos = 0
+
+    @property
+    def size(self):
+        return self._end - self._start
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({})".format(whence))
+        if pos < 0:
+            raise ValueError("Negative seek position {}".format(pos))
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        size = min(len(b), self.size - self._pos)
+        if size <= 0:
+            return 0
+        start = self._start + self._pos
+        with self.cluster._lock:
+            data, offset = self.cluster._get_data(start + size)
+            start += offset
+            try:
+                view = memoryview(data)[start : start + size]
+            except TypeError:
+                view = memoryview(data[start : start + size])
+            with view, memoryview(b).cast("B") as out:
+                out[:size] = view
+        self._pos += size
+        if self.on_read is not None:
+            self.on_read(self.cluster)
+        return size
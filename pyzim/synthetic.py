@@ -0,0 +1,114 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import math
+import os
+import random
+
+from .writer import Creator
+
+__all__ = ["generate_zim"]
+
+
+MIMETYPES = ["text/html", "text/plain"]
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    "consequat duis aute irure in reprehenderit voluptate velit esse cillum "
+    "eu fugiat nulla pariatur excepteur sint occaecat cupidatat non proident "
+    "sunt culpa qui officia deserunt mollit anim id est laborum"
+).split()
+
+
+def _blob_sizes(rng, count, blob_size, blob_sigma):
+    # Log-normal distribution of mean `blob_size`.
+    mu = math.log(blob_size) - blob_sigma**2 / 2
+    return [max(1, int(rng.lognormvariate(mu, blob_sigma))) for _ in range(count)]
+
+
+def generate_zim(
+    path,
+    articles=1000,
+    cluster_size=1024 * 1024,
+    blob_size=4096,
+    blob_sigma=1.0,
+    compression="xz",
+    redirects=0.1,
+    seed=0,
+    workers=0,
+):
+    """Write a valid zim file of synthetic content in `path`.
+
+    The archive contains `articles` articles in namespace A, whose blob
+    sizes follow a log-normal distribution of mean `blob_size`, packed in
+    clusters of about `cluster_size` bytes compressed with `compression`
+    ("none", "xz" or "zstd"). Blobs are put in clusters in a random order,
+    as a real archive isn't created in url order.
+    `redirects` is the number of redirects, as a ratio of `articles`.
+    Clusters are compressed by `workers` processes (see `Creator`).
+    The same arguments always produce the same file.
+
+    Return a dict describing the generated archive.
+    """
+    rng = random.Random(seed)
+    nb_redirects = int(articles * redirects)
+    corpus = " ".join(rng.choice(_WORDS) for _ in range(200000)).encode()
+
+    urls = []
+    titles = []
+    for number in range(articles):
+        urls.append("{}_{:08d}".format(rng.choice(_WORDS), number))
+        titles.append("{} {}".format(rng.choice(_WORDS).capitalize(), number))
+    targets = [rng.randrange(articles) for _ in range(nb_redirects)]
+    sizes = _blob_sizes(rng, articles, blob_size, blob_sigma)
+    creation_order = list(range(articles))
+    rng.shuffle(creation_order)
+    uuid = bytes(rng.randrange(256) for _ in range(16))
+
+    with Creator(
+        path,
+        compression=compression,
+        cluster_size=cluster_size,
+        workers=workers,
+        uuid=uuid,
+    ) as creator:
+        for number in creation_order:
+            start = rng.randrange(max(1, len(corpus) - sizes[number]))
+            creator.add_article(
+                "A",
+                urls[number],
+                titles[number],
+                MIMETYPES[number % 2],
+                corpus[start : start + sizes[number]],
+            )
+        for number, target in enumerate(targets):
+            creator.add_redirect(
+                "A", "redirect_{:08d}".format(number), "", "A", urls[target]
+            )
+        if articles:
+            creator.set_main_page("A", urls[0])
+
+    return {
+        "articles": articles,
+        "redirects": nb_redirects,
+        "clusters": creator.clusterCount,
+        "compression": compression,
+        "content_size": sum(sizes),
+        "file_size": os.path.getsize(path),
+    }
@@ -0,0 +1,168 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+from .algo import _as_key
+
+__all__ = ["UrlIndex", "build_url_index"]
+
+
+# A sidecar index file is:
+# - a header: magic, version, number of slots, zim uuid and zim checksum.
+# - an open addressing hash table of (tag, dirent index) slots.
+# The slot of a url is given by the low bits of a 64 bits hash of
+# namespace+url, the tag is the high 32 bits. Collisions are resolved by
+# linear probing.
+MAGIC = b"PYZIMIDX"
+VERSION = 1
+INDEX_HEADER = struct.Struct("<8sII16s16s")
+SLOT = struct.Struct("<II")
+EMPTY = 0xFFFFFFFF
+
+SUFFIX = ".urlidx"
+
+
+def archive_id(header):
+    """Return the (uuid, checksum) identifying the content of an archive.
+
+    The checksum is zeroed for archives without one.
+    """
+    try:
+        checksumPos = header.checksumPos
+    except ValueError:
+        return header.uuid, bytes(16)
+    return header.uuid, bytes(header.buf[checksumPos : checksumPos + 16])
+
+
+def _hash(ns, value):
+    digest = hashlib.blake2b(bytes([ns]) + value, digest_size=8).digest()
+    h = int.from_bytes(digest, "little")
+    return h & 0xFFFFFFFF, h >> 32
+
+
+def _nb_slots(count):
+    # Keep the table at most half full.
+    nb_slots = 1
+    while nb_slots < 2 * count:
+        nb_slots *= 2
+    return nb_slots
+
+
+class UrlIndex:
+    """A memory mapped sidecar hash index from namespace+url to url index."""
+
+    def __init__(self, path, header):
+        self.path = path
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, nb_slots, uuid, checksum = INDEX_HEADER.unpack_from(
+                self.buf, 0
+            )
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} is not a url index".format(path))
+            if (uuid, checksum) != archive_id(header):
+                raise ValueError("{} is the index of another archive".format(path))
+            if len(self.buf) != INDEX_HEADER.size + nb_slots * SLOT.size:
+                raise ValueError("{} is truncated".format(path))
+        except (ValueError, struct.error):
+            self.buf.close()
+            raise
+        self.nb_slots = nb_slots
+
+    def close(self):
+        self.buf.close()
+
+    def candidates(self, ns, url):
+        """Yield the indexes which may be (ns, url).
+
+        The caller must check the dirent, different urls may share a hash.
+        """
+        ns, value = _as_key(ns, url)
+        slot_hash, tag = _hash(ns, value)
+        mask = self.nb_slots - 1
+        slot = slot_hash & mask
+        while True:
+            slot_tag, index = SLOT.unpack_from(
+                self.buf, INDEX_HEADER.size + slot * SLOT.size
+            )
+            if index == EMPTY:
+                return
+            if slot_tag == tag:
+                yield index
+            slot = (slot + 1) & mask
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# The mode of the files written through a temporary file: mkstemp creates
+# them only readable by their owner.
+_FILE_MODE = 0o666 & ~_umask()
+
+
+def build_url_index(archive, path=None):
+    """Build the url index of `archive` in `path` and return it.
+
+    `path` defaults to the archive file name followed by `.urlidx`.
+    The index is written to a temporary file first, so a concurrent reader
+    never sees a partial index.
+    """
+    if path is None:
+        path = str(archive.filename) + SUFFIX
+    count = archive.articleCount
+    nb_slots = _nb_slots(count)
+    uuid, checksum = archive_id(archive.header)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w+b") as f:
+            f.write(INDEX_HEADER.pack(MAGIC, VERSION, nb_slots, uuid, checksum))
+            empty_slots = b"\xff" * (SLOT.size * 4096)
+            remaining = nb_slots * SLOT.size
+            while remaining:
+                remaining -= f.write(empty_slots[:remaining])
+            f.flush()
+            with mmap.mmap(f.fileno(), 0) as buf:
+                mask = nb_slots - 1
+                urlSearch = archive.urlSearch
+                for index in range(count):
+                    slot_hash, tag = _hash(*urlSearch.key(index))
+                    slot = slot_hash & mask
+                    while True:
+                        offset = INDEX_HEADER.size + slot * SLOT.size
+                        if SLOT.unpack_from(buf, offset)[1] == EMPTY:
+                            SLOT.pack_into(buf, offset, tag, index)
+                            break
+                        slot = (slot + 1) & mask
+                buf.flush()
+        os.chmod(tmp_path, _FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return UrlIndex(path, archive.header)
@@ -0,0 +1,459 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import heapq
+import lzma
+import marshal
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+__all__ = ["Creator"]
+
+
+MAGIC_NUMBER = 72173914
+
+_HEADER = struct.Struct("<IHH16sIIQQQQIIQ")
+_ARTICLE = struct.Struct("<HBcIII")
+_REDIRECT = struct.Struct("<HBcII")
+_UINT32 = struct.Struct("<I")
+_UINT64 = struct.Struct("<Q")
+
+# Entry kinds, in the external sort records.
+_ARTICLE_KIND = 0
+_REDIRECT_KIND = 1
+
+_COMPRESSION_TYPES = {"none": 1, "xz": 4, "zstd": 5}
+
+_COPY_SIZE = 4 * 1024 * 1024
+
+
+def compress_cluster(data, compression):
+    """Return the content of a cluster (info byte excluded) for `data`."""
+    if compression == "none":
+        return data
+    if compression == "xz":
+        return lzma.compress(data, format=lzma.FORMAT_XZ)
+    if compression == "zstd":
+        try:
+            from compression.zstd import compress
+        except ImportError:
+            try:
+                from pyzstd import compress
+            except ImportError:
+                raise RuntimeError(
+                    "Writing zstd clusters needs Python 3.14 or the pyzstd package"
+                )
+        return compress(data)
+    raise ValueError("Unknown compression {!r}".format(compression))
+
+
+def _build_cluster(blobs, compression):
+    """Return the full cluster (info byte included) containing `blobs`."""
+    total = (len(blobs) + 1) * 4 + sum(len(blob) for blob in blobs)
+    extended = total > 0xFFFFFFFF
+    offset_struct = _UINT64 if extended else _UINT32
+    offsets = [(len(blobs) + 1) * offset_struct.size]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    data = b"".join(offset_struct.pack(offset) for offset in offsets)
+    data += b"".join(blobs)
+    info = _COMPRESSION_TYPES[compression] | (0b10000 if extended else 0)
+    return bytes([info]) + compress_cluster(data, compression)
+
+
+class _ExternalSorter:
+    """Sort tuples with a bounded memory.
+
+    Items are buffered in memory and written in sorted runs of at most
+    `run_size` items to temporary files. Iterating merges the runs (and can be
+    done several times).
+    """
+
+    def __init__(self, tmpdir, run_size):
+        self.tmpdir = tmpdir
+        self.run_size = run_size
+        self._items = []
+        self._runs = []
+
+    def add(self, item):
+        self._items.append(item)
+        if len(self._items) >= self.run_size:
+            self._write_run()
+
+    def _write_run(self):
+        self._items.sort()
+        fd, path = tempfile.mkstemp(dir=self.tmpdir, suffix=".run")
+        with os.fdopen(fd, "wb") as f:
+            for item in self._items:
+                marshal.dump(item, f)
+        self._runs.append(path)
+        self._items = []
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield marshal.load(f)
+                except EOFError:
+                    return
+
+    def __iter__(self):
+        self._items.sort()
+        return heapq.merge(self._items, *(self._read_run(path) for path in self._runs))
+
+
+class _Cluster:
+    def __init__(self, number, compression):
+        self.number = number
+        self.compression = compression
+        self.blobs = []
+        self.size = 0
+
+
+class Creator:
+    """Write a zim file, streaming the content.
+
+    Blobs are packed in clusters of about `cluster_size` bytes as they are
+    added, and clusters are compressed by a pool of `workers` processes (all
+    the cpus if None, inline if 0) and written to the file right away.
+    Entries are sorted (by url and by title) with an external sort using
+    temporary files in `tmpdir`, keeping at most `sort_run_size` entries in
+    memory, so the memory used doesn't depend on the number of entries.
+
+    Articles are added to compressed clusters (with `compression`: "xz",
+    "zstd" or "none") unless their mimetype is not compressible (images,
+    videos...).
+
+    Readers expect the mimetype list right after the header, but the
+    mimetypes are only known at the end: `mimelist_size` bytes are reserved
+    for it before the clusters. If the list is larger, the clusters are moved
+    when finishing.
+    """
+
+    def __init__(
+        self,
+        path,
+        compression="xz",
+        cluster_size=2 * 1024 * 1024,
+        workers=None,
+        tmpdir=None,
+        sort_run_size=100000,
+        uuid=None,
+        mimelist_size=4096,
+    ):
+        if compression not in _COMPRESSION_TYPES:
+            raise ValueError("Unknown compression {!r}".format(compression))
+        # Fail now if the compression is not available.
+        compress_cluster(b"", compression)
+        self.path = path
+        self.compression = compression
+        self.cluster_size = cluster_size
+        self.uuid = uuid if uuid is not None else os.urandom(16)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(workers) if workers else None
+        self._max_pending = 2 * max(workers, 1)
+        self._pending = deque()
+        self._tmpdir = tempfile.mkdtemp(dir=tmpdir, prefix="pyzim-")
+        self._entries = _ExternalSorter(self._tmpdir, sort_run_size)
+        self._sort_run_size = sort_run_size
+        self._mimetypes = {}
+        self._main_page = None
+        self._cluster_offsets = array("Q")
+        self._clusters = {}
+        self._extended = False
+        self.mimelist_size = mimelist_size
+        self._file = open(path, "w+b")
+        # The header and the mimetype list are written once everything is
+        # known.
+        self._file.write(bytes(_HEADER.size + mimelist_size))
+        self._finished = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish()
+        else:
+            self._close()
+
+    def _close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._file.close()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    @property
+    def clusterCount(self):
+        return len(self._cluster_offsets)
+
+    @staticmethod
+    def _key(ns, value):
+        if isinstance(ns, str):
+            ns = ns.encode()
+        if isinstance(value, str):
+            value = value.encode()
+        if len(ns) != 1:
+            raise ValueError("Namespace must be one character")
+        return ns + value
+
+    def _mimetype_index(self, mimetype):
+        try:
+            return self._mimetypes[mimetype]
+        except KeyError:
+            index = self._mimetypes[mimetype] = len(self._mimetypes)
+            return index
+
+    @staticmethod
+    def _is_compressible(mimetype):
+        return not mimetype.startswith(("image/", "video/", "audio/")) and mimetype not in (
+            "application/zip",
+            "application/pdf",
+        )
+
+    def _current_cluster(self, compressed):
+        compression = self.compression if compressed else "none"
+        cluster = self._clusters.get(compression)
+        if cluster is None:
+            cluster = _Cluster(len(self._cluster_offsets), compression)
+            self._cluster_offsets.append(0)
+            self._clusters[compression] = cluster
+        return cluster
+
+    def _add_blob(self, content, compressed):
+        cluster = self._current_cluster(compressed)
+        if cluster.blobs and cluster.size + len(content) > self.cluster_size:
+            self._close_cluster(cluster)
+            cluster = self._current_cluster(compressed)
+        blob_number = len(cluster.blobs)
+        cluster.blobs.append(bytes(content))
+        cluster.size += len(content)
+        return cluster.number, blob_number
+
+    def _close_cluster(self, cluster):
+        del self._clusters[cluster.compression]
+        if cluster.compression == "none" or self._executor is None:
+            content = _build_cluster(cluster.blobs, cluster.compression)
+        else:
+            content = self._executor.submit(
+                _build_cluster, cluster.blobs, cluster.compression
+            )
+        # Clusters are written in the order they are closed, whatever the
+        # number of workers, but we don't keep more than a few in memory.
+        self._pending.append((cluster.number, content))
+        while len(self._pending) > self._max_pending:
+            self._write_pending()
+
+    def _write_pending(self):
+        number, content = self._pending.popleft()
+        if not isinstance(content, bytes):
+            content = content.result()
+        self._write_cluster(number, content)
+
+    def _write_cluster(self, number, content):
+        self._cluster_offsets[number] = self._file.tell()
+        self._extended |= bool(content[0] & 0b10000)
+        self._file.write(content)
+
+    def _move(self, start, end, shift):
+        """Move the bytes [start, end) of the file `shift` bytes further."""
+        f = self._file
+        position = end
+        while position > start:
+            size = min(_COPY_SIZE, position - start)
+            position -= size
+            f.seek(position)
+            data = f.read(size)
+            f.seek(position + shift)
+            f.write(data)
+
+    def add_article(self, ns, url, title, mimetype, content, compress=None):
+        """Add an article.
+
+        `compress` forces (or prevents) the compression of the content,
+        by default it depends on the mimetype.
+        """
+        if self._finished:
+            raise ValueError("Creator is finished")
+        key = self._key(ns, url)
+        if compress is None:
+            compress = self._is_compressible(mimetype)
+        if self.compression == "none":
+            compress = False
+        cluster_number, blob_number = self._add_blob(content, compress)
+        title = title.encode() if isinstance(title, str) else title
+        self._entries.add(
+            (
+                key,
+                title,
+                _ARTICLE_KIND,
+                self._mimetype_index(mimetype),
+                cluster_number,
+                blob_number,
+            )
+        )
+
+    def add_redirect(self, ns, url, title, target_ns, target_url):
+        if self._finished:
+            raise ValueError("Creator is finished")
+        key = self._key(ns, url)
+        title = title.encode() if isinstance(title, str) else title
+        self._entries.add(
+            (key, title, _REDIRECT_KIND, self._key(target_ns, target_url), 0, 0)
+        )
+
+    def add_metadata(self, name, value, mimetype="text/plain"):
+        if isinstance(value, str):
+            value = value.encode()
+        self.add_article("M", name, "", mimetype, value)
+
+    def set_main_page(self, ns, url):
+        self._main_page = self._key(ns, url)
+
+    def _sorted_entries(self):
+        """Yield (index, entry) in url order."""
+        previous = None
+        for index, entry in enumerate(self._entries):
+            if entry[0] == previous:
+                raise ValueError("Duplicate entry {!r}".format(entry[0]))
+            previous = entry[0]
+            yield index, entry
+
+    def _resolve_redirects(self):
+        """Return a sorter of (redirect index, target index)."""
+        targets = _ExternalSorter(self._tmpdir, self._sort_run_size)
+        for index, entry in self._sorted_entries():
+            if entry[2] == _REDIRECT_KIND:
+                targets.add((entry[3], index))
+        resolved = _ExternalSorter(self._tmpdir, self._sort_run_size)
+        # Merge join of the targets and the entries, both sorted by url.
+        entries = self._sorted_entries()
+        current_key, current_index = None, -1
+        for target_key, redirect_index in targets:
+            while current_key is None or current_key < target_key:
+                try:
+                    current_index, entry = next(entries)
+                except StopIteration:
+                    raise ValueError("Missing redirect target {!r}".format(target_key))
+                current_key = entry[0]
+            if current_key != target_key:
+                raise ValueError("Missing redirect target {!r}".format(target_key))
+            resolved.add((redirect_index, current_index))
+        return resolved
+
+    def finish(self):
+        """Write the remaining clusters and all the entries, then the
+        checksum."""
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            self._finish()
+        finally:
+            self._close()
+
+    def _finish(self):
+        for cluster in list(self._clusters.values()):
+            self._close_cluster(cluster)
+        while self._pending:
+            self._write_pending()
+
+        f = self._file
+        mimetypes = sorted(self._mimetypes, key=self._mimetypes.get)
+        mimelist = b"".join(m.encode() + b"\0" for m in mimetypes) + b"\0"
+        mimeListPos = _HEADER.size
+        end = f.tell()
+        shift = len(mimelist) - self.mimelist_size
+        if shift > 0:
+            self._move(mimeListPos + self.mimelist_size, end, shift)
+            for number, offset in enumerate(self._cluster_offsets):
+                self._cluster_offsets[number] = offset + shift
+            end += shift
+        # The rest of the reserved space is left zero filled.
+        f.seek(mimeListPos)
+        f.write(mimelist)
+        f.seek(end)
+
+        redirects = iter(self._resolve_redirects())
+        next_redirect = next(redirects, None)
+        titles = _ExternalSorter(self._tmpdir, self._sort_run_size)
+        url_pointers = tempfile.TemporaryFile(dir=self._tmpdir)
+        count = 0
+        mainPage = 0xFFFFFFFF
+        for index, entry in self._sorted_entries():
+            key, title, kind, value, cluster_number, blob_number = entry
+            ns, url = key[:1], key[1:]
+            url_pointers.write(_UINT64.pack(f.tell()))
+            if kind == _ARTICLE_KIND:
+                f.write(_ARTICLE.pack(value, 0, ns, 0, cluster_number, blob_number))
+            else:
+                assert next_redirect[0] == index
+                f.write(_REDIRECT.pack(0xFFFF, 0, ns, 0, next_redirect[1]))
+                next_redirect = next(redirects, None)
+            f.write(url + b"\0" + title + b"\0")
+            titles.add((ns + (title or url), index))
+            if key == self._main_page:
+                mainPage = index
+            count += 1
+
+        urlPtrPos = f.tell()
+        url_pointers.seek(0)
+        shutil.copyfileobj(url_pointers, f)
+        url_pointers.close()
+        titlePtrPos = f.tell()
+        for _title, index in titles:
+            f.write(_UINT32.pack(index))
+        clusterPtrPos = f.tell()
+        if sys.byteorder != "little":
+            self._cluster_offsets.byteswap()
+        self._cluster_offsets.tofile(f)
+        checksumPos = f.tell()
+
+        f.seek(0)
+        f.write(
+            _HEADER.pack(
+                MAGIC_NUMBER,
+                6 if self._extended else 5,
+                0,
+                self.uuid,
+                count,
+                len(self._cluster_offsets),
+                urlPtrPos,
+                titlePtrPos,
+                clusterPtrPos,
+                mimeListPos,
+                mainPage,
+                0xFFFFFFFF,
+                checksumPos,
+            )
+        )
+        f.flush()
+        f.seek(0)
+        md5 = hashlib.md5()
+        for chunk in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            md5.update(chunk)
+        f.write(md5.digest())
@@ -0,0 +1,26 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+from .test_sample import sampleZim_content
+
+
+@pytest.fixture
+def zim_path(tmp_path):
+    """The sample archive, written in `tmp_path`."""
+    path = tmp_path / "sample.zim"
+    path.write_bytes(sampleZim_content)
+    return path
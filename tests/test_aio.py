@@ -0,0 +1,55 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from pyzim import Archive, AsyncArchive
+from .test_sample import sampleZim_content
+
+
+def test_async_archive():
+    async def run():
+        archive = AsyncArchive(Archive(sampleZim_content, cache_size=0))
+        d0, d2 = await asyncio.gather(
+            archive.get_by_url(b"A", "Auto"), archive.get_by_url(b"B", "Auto")
+        )
+        blobs = await asyncio.gather(
+            archive.get_blob(d0), archive.get_blob(d2), archive.get_blob(d0)
+        )
+        assert blobs == [b"<h1>Auto</h1>", b"Auto", b"<h1>Auto</h1>"]
+        # Only one decompression for the three requests.
+        assert archive.cache.misses == 3
+        assert archive.merged == 2
+        assert await archive.get_blob(d2) == b"Auto"
+        assert archive.cache.hits == 1
+        with pytest.raises(IndexError):
+            await archive.get_by_url(b"A", "Nothing")
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("executor_class", [ThreadPoolExecutor, ProcessPoolExecutor])
+def test_async_archive_executor(zim_path, executor_class):
+    async def run():
+        with executor_class(1) as executor:
+            async with AsyncArchive.open(zim_path, executor) as archive:
+                d2 = await archive.get_by_url(b"B", "Auto")
+                assert await archive.get_blob(d2) == b"Auto"
+
+    asyncio.run(run())
@@ -0,0 +1,162 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pytest
+from pyzim import Archive, ClusterCache
+from .test_sample import sampleZim_content
+
+
+def test_clusterCache_lru():
+    cache = ClusterCache(10)
+    cache.put(0, "c0", 4)
+    cache.put(1, "c1", 4)
+    assert cache.get(0) == "c0"
+    cache.put(2, "c2", 4)
+    # 1 was the least recently used entry.
+    assert cache.get(1) is None
+    assert cache.get(0) == "c0"
+    assert cache.get(2) == "c2"
+    assert cache.size == 8
+    assert cache.stats["hits"] == 3
+    assert cache.stats["misses"] == 1
+    assert cache.stats["evictions"] == 1
+
+
+def test_clusterCache_too_big():
+    cache = ClusterCache(10)
+    cache.put(0, "c0", 4)
+    cache.put(1, "c1", 11)
+    assert cache.get(1) is None
+    assert cache.get(0) == "c0"
+
+
+def test_archive_open(zim_path):
+    with Archive.open(zim_path) as archive:
+        assert archive.articleCount == 3
+        assert archive.clusterCount == 1
+        d = archive.get_dirent(0)
+        assert d.url == "Auto"
+        assert archive.get_mimetype(d) == "text/html"
+        with pytest.raises(IndexError):
+            archive.get_dirent(3)
+
+
+def test_archive_cluster_cache():
+    archive = Archive(sampleZim_content)
+    d0 = archive.get_dirent(0)
+    d2 = archive.get_dirent(2)
+    assert archive.get_blob_data(d0) == b"<h1>Auto</h1>"
+    assert archive.get_blob_data(d2) == b"Auto"
+    assert archive.cache.misses == 1
+    assert archive.cache.hits == 1
+    assert archive.get_cluster(0) is archive.get_cluster(0)
+
+
+def test_archive_blob_view_readonly():
+    archive = Archive(sampleZim_content)
+    d0 = archive.get_dirent(0)
+    view = archive.get_blob_view(d0)
+    with pytest.raises(TypeError):
+        view[0:4] = b"EVIL"
+    view.release()
+    assert archive.get_blob_data(d0) == b"<h1>Auto</h1>"
+
+
+def test_archive_open_blob_cache(tmp_path):
+    from pyzim.synthetic import generate_zim
+
+    path = tmp_path / "synthetic.zim"
+    generate_zim(path, articles=100, cluster_size=64 * 1024, blob_size=512)
+    with Archive.open(path) as archive:
+        dirents = [archive.get_dirent(i) for i in range(archive.header.articleCount)]
+        last = max(
+            (d for d in dirents if d.kind == "article" and d.clusterNumber == 0),
+            key=lambda d: d.blobNumber,
+        )
+        with archive.open_blob(last) as reader:
+            cluster = reader.cluster
+            assert cluster.compressed
+            before = archive.cache.size
+            data = reader.read()
+        assert cluster.decompressed_size > before
+        assert archive.cache.size == cluster.decompressed_size
+        assert data == archive.get_blob_data(last)
+
+
+def test_archive_find():
+    archive = Archive(sampleZim_content)
+    assert archive.find_by_url(b"A", "Automobile") == 1
+    assert archive.find_by_url(b"B", "Auto") == 2
+
+
+def test_archive_prefix():
+    archive = Archive(sampleZim_content)
+    assert [d.url for d in archive.iter_by_url_prefix(b"A", "Auto")] == [
+        "Auto",
+        "Automobile",
+    ]
+    assert [d.url for d in archive.iter_by_title_prefix(b"A", "Automo")] == [
+        "Automobile"
+    ]
+
+
+def test_archive_iter_articles_by_cluster():
+    archive = Archive(sampleZim_content)
+    starts, indexes = archive.cluster_order()
+    assert list(starts) == [0, 2]
+    assert list(indexes) == [0, 2]
+    articles = [(d.url, blob) for d, blob in archive.iter_articles_by_cluster()]
+    assert articles == [("Auto", b"<h1>Auto</h1>"), ("Auto", b"Auto")]
+    assert len(archive.cache) == 0
+
+
+def test_archive_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from pyzim import Cluster, metrics
+    from pyzim.synthetic import generate_zim
+
+    path = tmp_path / "synthetic.zim"
+    generate_zim(path, articles=300, cluster_size=8 * 1024, blob_size=512)
+    with Archive.open(path) as archive:
+        expected = {d.url: b for d, b in archive.iter_articles_by_cluster()}
+        content_size = sum(
+            len(Cluster(archive.buf, offset).data[0])
+            for offset in archive.clusterPtrList
+        )
+
+    sink = metrics.HistogramSink()
+    metrics.enable(sink)
+    try:
+        with Archive.open(path, cache_size=1024 * 1024) as archive:
+            dirents = [archive.get_dirent(i) for i in range(archive.articleCount)]
+            dirents = [d for d in dirents if d.kind == "article"] * 4
+            with ThreadPoolExecutor(8) as executor:
+                blobs = list(executor.map(archive.get_blob_data, dirents))
+    finally:
+        metrics.disable()
+    assert blobs == [expected[d.url] for d in dirents]
+    # Each cluster was decompressed once, whatever the number of readers.
+    decompressed = sink.snapshot()[
+        ("cluster_decompress_bytes", (("compression", "xz"),))
+    ]
+    assert decompressed["sum"] == content_size
+
+
+def test_archive_shared_cluster(zim_path):
+    with Archive.open(zim_path, cache_size=0) as archive:
+        cluster = archive.get_cluster(0)
+        assert archive.get_cluster(0) is cluster
@@ -87,3 +87,42 @@ def test_baseArray_uint64():
         assert a[i] == v
     with pytest.raises(IndexError):
         a[max_index]
+
+
+def test_baseArray_sized():
+    class Array32(BaseArray):
+        ctype = CTYPES["c_uint32"]
+
+    a = Array32(array_content, 8, 4)
+    assert len(a) == 4
+    assert list(a) == [0x0B0A0908, 0x0F0E0D0C, 0x13121110, 0x17161514]
+    assert a[-1] == 0x17161514
+    with pytest.raises(IndexError):
+        a[4]
+
+    s = a[1:3]
+    assert isinstance(s, Array32)
+    assert len(s) == 2
+    assert list(s) == [0x0F0E0D0C, 0x13121110]
+    assert a[::2] == [0x0B0A0908, 0x13121110]
+    assert a[[3, 0]] == [0x17161514, 0x0B0A0908]
+
+
+def test_baseArray_unsized_len():
+    class Array64(BaseArray):
+        ctype = CTYPES["c_uint64"]
+
+    a = Array64(array_content, 0)
+    assert len(a) == 0x60 // 8
+    assert list(a[10:]) == [a[10], a[11]]
+
+
+def test_baseArray_numpy():
+    numpy = pytest.importorskip("numpy")
+
+    class Array32(BaseArray):
+        ctype = CTYPES["c_uint32"]
+
+    a = Array32(array_content, 0, 0x60 // 4)
+    assert list(a[numpy.array([2, 1])]) == [a[2], a[1]]
+    assert list(a.as_numpy()) == list(a)
@@ -1,4 +1,8 @@
-from pyzim import bisect
+import mmap
+
+from pyzim import bisect, findByUrl, findByTitle, UrlSearch, TitleSearch, Header
+from pyzim import iterByUrlPrefix, iterByTitlePrefix, findMany
+from .test_sample import sampleZim_content
 import pytest
 
 
@@ -10,4 +14,108 @@ def test_bisect():
     assert bisect(comp, 5, 10) == 5
     with pytest.raises(IndexError):
         bisect(comp, 5, 5)
+    with pytest.raises(IndexError):
         bisect(comp, 0, 5)
+    with pytest.raises(IndexError):
+        bisect(comp, 6, 10)
+
+
+def test_findByUrl():
+    h = Header(sampleZim_content, 0)
+    assert findByUrl(h, b"A", "Auto") == 0
+    assert findByUrl(h, b"A", "Automobile") == 1
+    assert findByUrl(h, b"B", "Auto") == 2
+    for ns, url in ((b"A", "Aut"), (b"A", "Autoz"), (b"B", "Z"), (b"0", "Auto")):
+        with pytest.raises(IndexError):
+            findByUrl(h, ns, url)
+
+
+def test_findByTitle():
+    h = Header(sampleZim_content, 0)
+    # Titles are empty, the url is used instead.
+    assert findByTitle(h, b"A", "Auto") == 0
+    assert findByTitle(h, b"B", "Auto") == 2
+    with pytest.raises(IndexError):
+        findByTitle(h, b"C", "Auto")
+
+
+def test_bounds():
+    s = UrlSearch(Header(sampleZim_content, 0))
+    assert s.key(1) == (ord("A"), b"Automobile")
+    assert s.lower_bound(b"A", "Auto") == 0
+    assert s.upper_bound(b"A", "Auto") == 1
+    assert s.lower_bound(b"A", "Autoa") == 1
+    assert s.lower_bound(b"A", "Z") == 2
+    assert s.upper_bound(b"B", "Auto") == 3
+    assert s.lower_bound(b"B", b"Auto", 0, 2) == 2
+    assert s.lower_bound(b"0", "") == 0
+
+    t = TitleSearch(Header(sampleZim_content, 0))
+    assert t.lower_bound(b"A", "Automobile") == 1
+    assert t.upper_bound(b"A", "Automobile") == 2
+
+
+def test_prefix():
+    h = Header(sampleZim_content, 0)
+    assert [d.url for d in iterByUrlPrefix(h, b"A", "Auto")] == ["Auto", "Automobile"]
+    assert [d.url for d in iterByUrlPrefix(h, b"A", "Automo")] == ["Automobile"]
+    assert [d.url for d in iterByUrlPrefix(h, b"A", "Auto", limit=1)] == ["Auto"]
+    assert [d.url for d in iterByUrlPrefix(h, b"A", "")] == ["Auto", "Automobile"]
+    assert [d.url for d in iterByUrlPrefix(h, b"B", "A")] == ["Auto"]
+    assert list(iterByUrlPrefix(h, b"A", "B")) == []
+    assert list(iterByUrlPrefix(h, b"C", "")) == []
+    assert [d.namespace for d in iterByTitlePrefix(h, b"B", "Au")] == [b"B"]
+
+
+def test_findMany():
+    h = Header(sampleZim_content, 0)
+    queries = [
+        (b"B", "Auto"),
+        (b"A", "Aut"),
+        ("A", "Auto"),
+        (b"A", "Automobile"),
+        (b"A", b"Auto"),
+        (b"C", ""),
+        (b"0", "Auto"),
+    ]
+    assert findMany(h, queries) == [2, None, 0, 1, 0, None, None]
+    assert findMany(h, []) == []
+
+
+def test_find_many_synthetic(tmp_path):
+    import random
+    from pyzim import Archive
+    from pyzim.synthetic import generate_zim
+
+    path = tmp_path / "synthetic.zim"
+    generate_zim(path, articles=500)
+    with Archive.open(path) as archive:
+        rng = random.Random(0)
+        queries = []
+        for index in rng.sample(range(archive.articleCount), 100):
+            dirent = archive.get_dirent(index)
+            queries.append((dirent.namespace, dirent.url))
+            queries.append((dirent.namespace, dirent.url + "_missing"))
+        queries += queries[:10]
+        expected = []
+        for ns, url in queries:
+            try:
+                expected.append(archive.find_by_url(ns, url))
+            except IndexError:
+                expected.append(None)
+        assert archive.find_many(queries) == expected
+
+
+def test_functional_api_mmap(zim_path):
+    with open(zim_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            h = Header(mm, 0)
+            with pytest.raises(IndexError):
+                findByUrl(h, b"A", "missing")
+            with pytest.raises(IndexError):
+                findByTitle(h, b"A", "missing")
+            assert findMany(h, [(b"A", "Auto")]) == [0]
+            urls = iterByUrlPrefix(h, b"A", "Auto")
+            titles = iterByTitlePrefix(h, b"A", "Auto")
+            assert next(urls).url == "Auto"
+            assert next(titles).url == "Auto"
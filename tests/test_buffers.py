@@ -0,0 +1,113 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import random
+
+import pytest
+from pyzim import Archive, PreadBuffer, split_parts, verify_checksum
+from pyzim.check import check_archive
+from pyzim.synthetic import generate_zim
+from .test_sample import sampleZim_content
+
+
+def split(content, path, sizes):
+    """Write `content` in the parts of `path`, of `sizes` bytes (and the
+    rest)."""
+    parts = []
+    start = 0
+    for index, size in enumerate(list(sizes) + [len(content)]):
+        part = "{}a{}".format(path, "abcdefghijklmnopqrstuvwxyz"[index])
+        with open(part, "wb") as f:
+            f.write(content[start : start + size])
+        parts.append(part)
+        start += size
+        if start >= len(content):
+            break
+    return parts
+
+
+def test_split_parts(tmp_path):
+    path = str(tmp_path / "test.zim")
+    assert split_parts(path) is None
+    parts = split(sampleZim_content, path, [100, 0, 50])
+    assert split_parts(path) == parts
+    assert split_parts(path + "aa") == parts
+    (tmp_path / "other.zim").write_bytes(sampleZim_content)
+    assert split_parts(tmp_path / "other.zim") is None
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 64, 4096])
+def test_pread_buffer(tmp_path, page_size):
+    content = bytes(random.Random(0).randrange(4) for _ in range(1000))
+    parts = split(content, str(tmp_path / "test.zim"), [10, 0, 333, 1, 400])
+    buf = PreadBuffer(parts, page_size=page_size, cache_pages=3)
+    try:
+        assert len(buf) == len(content)
+        rng = random.Random(page_size)
+        for _ in range(200):
+            start = rng.randrange(len(content))
+            stop = start + rng.randrange(100)
+            assert buf[start:stop] == content[start:stop]
+            assert buf[start] == content[start]
+            for sub in (b"\0", b"\1\2", b"\3\3\3"):
+                assert buf.find(sub, start) == content.find(sub, start)
+                assert buf.find(sub, start, stop) == content.find(sub, start, stop)
+        assert buf[-1] == content[-1]
+        assert buf[990:] == content[990:]
+        assert buf[::100] == content[::100]
+        with pytest.raises(IndexError):
+            buf[len(content)]
+    finally:
+        buf.close()
+
+
+def test_split_archive(tmp_path):
+    path = tmp_path / "test.zim"
+    split(sampleZim_content, str(path), [100, 150])
+    with Archive.open(path, page_size=16) as archive:
+        assert isinstance(archive.buf, PreadBuffer)
+        assert archive.fileno() is None
+        index = archive.find_by_url("A", "Auto")
+        dirent = archive.get_dirent(index)
+        blob = archive.get_blob_data(dirent)
+        assert bytes(archive.get_blob_view(dirent)) == blob
+        assert archive.open_blob(dirent).read() == blob
+        assert archive.resolve_redirect(archive.find_by_url("A", "Automobile")) == index
+        assert list(archive.mimetypes) == ["text/html", "text/plain"]
+    assert verify_checksum(path)
+    assert list(check_archive(path, workers=1)) == []
+
+
+def test_pread_archive(tmp_path):
+    path = tmp_path / "test.zim"
+    generate_zim(path, articles=50, compression="none")
+    with Archive.open(path) as mapped, Archive.open(
+        path, pread=True, page_size=100, cache_pages=4
+    ) as read:
+        assert isinstance(read.buf, PreadBuffer)
+        expected = list(mapped.iter_articles_by_cluster())
+        assert [(d.url, b) for d, b in read.iter_articles_by_cluster()] == [
+            (d.url, b) for d, b in expected
+        ]
+        dirent = expected[0][0]
+        assert bytes(read.get_blob_view(dirent)) == expected[0][1]
+        assert read.open_blob(dirent).read() == expected[0][1]
+        for index in range(mapped.articleCount):
+            title_dirent = mapped.get_dirent_by_title(index)
+            assert read.find_by_title(
+                title_dirent.namespace, title_dirent.title or title_dirent.url
+            ) == index
@@ -0,0 +1,91 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import struct
+
+import pytest
+from pyzim.check import check_archive
+from pyzim.structs import Header
+from pyzim.synthetic import generate_zim
+from .test_sample import sampleZim_content
+
+
+def write_zim(tmp_path, content):
+    path = tmp_path / "sample.zim"
+    path.write_bytes(content)
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_check_valid(zim_path, workers):
+    assert list(check_archive(zim_path, workers=workers, shard_size=2)) == []
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_check_invalid(tmp_path, workers):
+    content = bytearray(sampleZim_content)
+    # Redirect target of the second dirent.
+    content[168:172] = bytes([0x10, 0x00, 0x00, 0x00])
+    # Swap the url pointers of the second and third dirents.
+    content[110:118], content[118:126] = content[118:126], content[110:118]
+    # Mimetype of the third dirent.
+    content[184] = 0x05
+    path = write_zim(tmp_path, content)
+    problems = sorted(
+        (p.check, p.index) for p in check_archive(path, workers=workers, shard_size=2)
+    )
+    assert problems == [
+        ("mimetype", 1),
+        ("redirect", 2),
+        ("title_order", 2),
+        ("url_order", 2),
+    ]
+
+
+def test_check_max_problems(tmp_path):
+    content = bytearray(sampleZim_content)
+    content[168:172] = bytes([0x10, 0x00, 0x00, 0x00])
+    content[184] = 0x05
+    path = write_zim(tmp_path, content)
+    problems = list(check_archive(path, workers=1, max_problems=1))
+    assert [p.check for p in problems] == ["redirect", "truncated"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_check_corrupt_pointer(tmp_path, workers):
+    path = tmp_path / "synthetic.zim"
+    generate_zim(path, articles=20, compression="none", redirects=0)
+    content = bytearray(path.read_bytes())
+    header = Header(bytes(content), 0)
+    # The url pointer of the sixth dirent goes past the end of the file.
+    struct.pack_into("<Q", content, header.urlPtrPos + 5 * 8, len(content) + 100)
+    path.write_bytes(content)
+    problems = list(check_archive(path, workers=workers, shard_size=4))
+    assert ("dirent", 5) in [(p.check, p.index) for p in problems]
+    assert {p.check for p in problems} <= {"dirent", "url_order", "title_order"}
+    assert any(p.check == "title_order" for p in problems)
+
+
+def test_check_truncated(tmp_path):
+    path = tmp_path / "synthetic.zim"
+    generate_zim(path, articles=50, compression="none")
+    content = path.read_bytes()
+    for size in (0, 50, 100, len(content) // 3, len(content) // 2, len(content) - 300):
+        path.write_bytes(content[:size])
+        problems = list(check_archive(path, workers=1))
+        assert problems, size
+        assert {p.check for p in problems} == {"header"}, size
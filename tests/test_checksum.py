@@ -0,0 +1,45 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pyzim
+from pyzim.checksum import main
+from .test_sample import sampleZim_content
+
+
+def test_verify_checksum():
+    archive = pyzim.Archive(sampleZim_content)
+    progress = []
+    assert pyzim.verify_checksum(
+        archive, chunk_size=100, progress=lambda *p: progress.append(p)
+    )
+    assert progress == [(100, 295), (200, 295), (295, 295)]
+
+    content = bytearray(sampleZim_content)
+    content[200] ^= 0xFF
+    assert not pyzim.verify_checksum(pyzim.Archive(content))
+
+
+def test_checksum_main(tmp_path, capsys):
+    good = tmp_path / "good.zim"
+    good.write_bytes(sampleZim_content)
+    bad = tmp_path / "bad.zim"
+    bad.write_bytes(sampleZim_content[:-1] + b"\0")
+    assert main([str(good)]) == 0
+    assert main([str(good), str(bad)]) == 1
+    out = capsys.readouterr().out
+    assert "good.zim: OK" in out
+    assert "bad.zim: FAILED" in out
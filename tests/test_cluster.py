@@ -15,6 +15,7 @@
 # along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import io
 import pytest
 import pyzim
 from itertools import product, chain
@@ -53,3 +54,82 @@ def test_mimeList_content(cluster_info):
         assert c.get_blob_data(i) == bytes([i]) * i * 10
     with pytest.raises(IndexError):
         c.get_blob_data(nbBlob)
+
+
+def test_partial_decompression():
+    blobs = [bytes([index]) * 100000 for index in range(10)]
+    offset_array = [(len(blobs) + 1) * 4]
+    for blob in blobs:
+        offset_array.append(offset_array[-1] + len(blob))
+    full_data = b"".join(chain((pack("<I", off) for off in offset_array), blobs))
+    c = pyzim.Cluster(bytes([4]) + compress(full_data), 0)
+    assert c.get_blob_data(0) == blobs[0]
+    assert c.decompressed_size == offset_array[1]
+    assert c.get_blob_data(3) == blobs[3]
+    assert c.decompressed_size == offset_array[4]
+    # Going back doesn't decompress anything.
+    assert c.get_blob_data(1) == blobs[1]
+    assert c.decompressed_size == offset_array[4]
+    assert c.nb_blobs == 10
+    assert c.get_blob_data(9) == blobs[9]
+    assert c.data == (full_data, 0)
+
+
+def test_blob_view(cluster_info):
+    cluster_content, compressed, extended, nbBlob = cluster_info
+    c = pyzim.Cluster(cluster_content, 0)
+    for i in range(nbBlob):
+        view = c.get_blob_view(i)
+        assert isinstance(view, memoryview)
+        assert view.readonly
+        assert view == bytes([i]) * i * 10
+        view.release()
+    with pytest.raises(IndexError):
+        c.get_blob_view(nbBlob)
+
+
+def test_blob_reader(cluster_info):
+    cluster_content, compressed, extended, nbBlob = cluster_info
+    c = pyzim.Cluster(cluster_content, 0)
+    for i in range(nbBlob):
+        with c.open_blob(i) as reader:
+            assert reader.size == i * 10
+            assert reader.read(5) == bytes([i]) * min(5, i * 10)
+            assert reader.read() == bytes([i]) * max(0, i * 10 - 5)
+            assert reader.read() == b""
+            reader.seek(-min(3, i * 10), io.SEEK_END)
+            assert reader.tell() == max(0, i * 10 - 3)
+            assert reader.read() == bytes([i]) * min(3, i * 10)
+
+
+def zstd_compress(data):
+    try:
+        from compression.zstd import compress as zcompress
+    except ImportError:
+        zcompress = pytest.importorskip("pyzstd").compress
+    return zcompress(data)
+
+
+@pytest.mark.parametrize("extended", [True, False])
+def test_zstd_cluster(extended):
+    offset_size = 8 if extended else 4
+    blobs = [bytes([index]) * 100000 for index in range(10)]
+    offset_array = [(len(blobs) + 1) * offset_size]
+    for blob in blobs:
+        offset_array.append(offset_array[-1] + len(blob))
+    pack_format = "<Q" if extended else "<I"
+    full_data = b"".join(chain((pack(pack_format, off) for off in offset_array), blobs))
+    info = (0b10000 if extended else 0) + 5
+    c = pyzim.Cluster(bytes([info]) + zstd_compress(full_data), 0)
+    assert c.compression == 5
+    assert c.get_blob_data(1) == blobs[1]
+    assert c.decompressed_size < len(full_data)
+    assert c.nb_blobs == 10
+    assert c.get_blob_data(9) == blobs[9]
+    assert c.data == (full_data, 0)
+
+
+def test_unsupported_compression():
+    c = pyzim.Cluster(bytes([2]) + b"garbage", 0)
+    with pytest.raises(ValueError):
+        c.get_blob_data(0)
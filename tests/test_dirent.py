@@ -123,3 +123,42 @@ def test_deletedDirent():
     assert d.url == "B/bar.html"
     assert d.title == "Bar"
     assert d.extra_data == b""
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        articleDirent_content,
+        redirectDirent_content,
+        linkDirent_content,
+        deletedDirent_content,
+    ],
+)
+def test_direntRecord(content):
+    d = pyzim.Dirent(content, 0)
+    r = pyzim.DirentRecord(content, 0)
+    fields = ["kind", "mimetype", "parameter_len", "namespace", "revision"]
+    fields += ["url", "title", "extra_data"]
+    if d.kind == "article":
+        fields += ["clusterNumber", "blobNumber"]
+    elif d.kind == "redirect":
+        fields += ["redirect_index"]
+    for field in fields:
+        assert getattr(r, field) == getattr(d, field)
+    with pytest.raises(AttributeError):
+        r.some_attribute = None
+
+
+def test_direntRecord_extra_data():
+    content = (
+        bytes([0x02, 0x00, 0x03])  # mimetype, parameterlen
+        + b"A"  # namespace
+        + bytes([0x00] * 4)  # revision
+        + bytes([0x01, 0x00, 0x00, 0x00])  # clusterNumber
+        + bytes([0x02, 0x00, 0x00, 0x00])  # blobNumber
+        + b"foo\0Foo\0xyzgarbage"
+    )
+    r = pyzim.DirentRecord(content, 0)
+    assert r.url == "foo"
+    assert r.title == "Foo"
+    assert r.extra_data == b"xyz"
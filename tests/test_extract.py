@@ -0,0 +1,87 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+from types import SimpleNamespace
+
+import pytest
+from pyzim.extract import entry_path, extract
+from .test_sample import sampleZim_content
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extract(zim_path, tmp_path, workers):
+    outdir = tmp_path / "out"
+    progress = []
+    summary = extract(
+        zim_path, outdir, workers=workers, progress=lambda *p: progress.append(p)
+    )
+    assert summary == {"articles": 2, "redirects": 1, "errors": 0}
+    assert progress == [(2, 2)]
+    assert (outdir / "A" / "Auto").read_bytes() == b"<h1>Auto</h1>"
+    assert (outdir / "B" / "Auto").read_bytes() == b"Auto"
+    assert os.readlink(outdir / "A" / "Automobile") == "Auto"
+    assert (outdir / "A" / "Automobile").read_bytes() == b"<h1>Auto</h1>"
+
+    # Everything is done, nothing to do on resume.
+    summary = extract(zim_path, outdir, workers=workers)
+    assert summary == {"articles": 0, "redirects": 0, "errors": 0}
+
+    summary = extract(zim_path, outdir, workers=workers, resume=False)
+    assert summary == {"articles": 2, "redirects": 1, "errors": 0}
+
+
+def test_extract_stub(zim_path, tmp_path):
+    outdir = tmp_path / "out"
+    extract(zim_path, outdir, workers=1, redirects="stub")
+    assert b'url=Auto"' in (outdir / "A" / "Automobile").read_bytes()
+
+
+def test_extract_files(zim_path, tmp_path):
+    outdir = tmp_path / "out"
+    extract(zim_path, outdir, workers=1)
+    # No temporary file is left and the files get the usual permissions.
+    assert sorted(os.listdir(outdir / "A")) == ["Auto", "Automobile"]
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(outdir / "B" / "Auto").st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_entry_path():
+    def path(namespace, url):
+        return entry_path("out", SimpleNamespace(namespace=namespace, url=url))
+
+    assert path(b"A", "a/b") == os.path.join("out", "A", "a", "b")
+    assert path(b"A", "../a//.") == os.path.join("out", "A", "%2E%2E", "a", "%", "%2E")
+    # The namespace can't escape the output directory either.
+    assert path(b"/", "etc/passwd") == os.path.join("out", "%2F", "etc", "passwd")
+    assert path(b".", "a") == os.path.join("out", "%2E", "a")
+    assert path(b"\xff", "a") == os.path.join("out", "%FF", "a")
+
+
+def test_extract_undecodable(tmp_path):
+    content = bytearray(sampleZim_content)
+    # A non utf-8 url for the first dirent (the redirect target).
+    content[138 + 16 + 3] = 0xFF
+    # A non utf-8 namespace for the third one.
+    content[184 + 3] = 0xFF
+    path = tmp_path / "sample.zim"
+    path.write_bytes(content)
+    outdir = tmp_path / "out"
+    summary = extract(path, outdir, workers=1)
+    assert summary == {"articles": 1, "redirects": 0, "errors": 2}
+    assert (outdir / "%FF" / "Auto").read_bytes() == b"Auto"
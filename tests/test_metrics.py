@@ -0,0 +1,88 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+
+import pytest
+import pyzim
+from pyzim import metrics
+from .test_sample import sampleZim_content
+
+
+@pytest.fixture
+def sink():
+    sink = metrics.PrometheusSink()
+    metrics.enable(sink)
+    yield sink
+    metrics.disable()
+
+
+def test_disabled():
+    calls = []
+    archive = pyzim.Archive(sampleZim_content)
+    archive.get_blob_data(archive.get_dirent(archive.find_by_url("A", "Auto")))
+    assert not metrics.enabled
+    metrics.enable(lambda *args: calls.append(args))
+    metrics.disable()
+    archive.find_by_url("B", "Auto")
+    assert calls == []
+
+
+def test_metrics(sink):
+    calls = []
+    metrics.enable(lambda *args: calls.append(args))
+    archive = pyzim.Archive(sampleZim_content)
+    index = archive.find_by_url("A", "Auto")
+    archive.find_by_title("B", "Auto")
+    archive.get_blob_data(archive.get_dirent(index))
+
+    snapshot = sink.snapshot()
+    assert snapshot[("lookup_probes", (("order", "url"),))]["count"] == 1
+    assert snapshot[("lookup_probes", (("order", "title"),))]["max"] == 2
+    assert snapshot[("dirent_decodes", ())]["count"] == 1
+    assert snapshot[("buffer_bytes_read", (("source", "dirent"),))]["sum"] == 22
+    decompressed = snapshot[("cluster_decompress_bytes", (("compression", "xz"),))]
+    assert decompressed["sum"] > 0
+    assert snapshot[("cluster_decompress_seconds", (("compression", "xz"),))][
+        "count"
+    ] == decompressed["count"]
+    assert ("dirent_decodes", 1, {}) in calls
+
+    text = sink.render()
+    assert "# TYPE pyzim_lookup_probes histogram\n" in text
+    assert 'pyzim_lookup_probes_bucket{order="url",le="+Inf"} 1\n' in text
+    assert 'pyzim_lookup_probes_count{order="title"} 1\n' in text
+
+    sink.reset()
+    assert sink.snapshot() == {}
+
+
+def test_prometheus_write(tmp_path, monkeypatch):
+    sink = metrics.PrometheusSink()
+    sink("lookup_probes", 3, {"order": "url"})
+    path = tmp_path / "pyzim.prom"
+    sink.write(path)
+    assert path.read_text() == sink.render()
+    assert os.listdir(tmp_path) == ["pyzim.prom"]
+
+    def fail():
+        raise RuntimeError("render failure")
+
+    monkeypatch.setattr(sink, "render", fail)
+    with pytest.raises(RuntimeError):
+        sink.write(tmp_path / "other.prom")
+    assert os.listdir(tmp_path) == ["pyzim.prom"]
@@ -39,3 +39,23 @@ def test_mimeList_content():
     assert m[2] == "image/png"
     with pytest.raises(IndexError):
         m[3]
+
+
+def test_mimeList_index():
+    m = pyzim.MimetypeList(mimeList_content, 0)
+    assert list(m) == ["text/html", "text/plain", "image/png"]
+    assert m.offsets == [0, 10, 21]
+    assert m.index("image/png") == 2
+    with pytest.raises(ValueError):
+        m.index("Some garbage")
+
+
+def test_header_mimetypeList():
+    from .test_sample import sampleZim_content
+
+    header = pyzim.Header(sampleZim_content, 0)
+    assert header.mimetypeList is header.mimetypeList
+    assert list(header.mimetypeList) == ["text/html", "text/plain"]
+    archive = pyzim.Archive(sampleZim_content)
+    assert archive.mimetypes is archive.header.mimetypeList
+    assert archive.get_mimetype(archive.get_dirent(0)) == "text/html"
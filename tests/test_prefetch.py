@@ -0,0 +1,69 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+
+import pytest
+from pyzim import Archive, Cluster, ClusterPrefetcher, prefetch
+from pyzim.synthetic import generate_zim
+
+
+@pytest.fixture(scope="module")
+def synthetic_zim_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("prefetch") / "synthetic.zim"
+    generate_zim(path, articles=200, cluster_size=8 * 1024, blob_size=512)
+    return path
+
+
+def test_prefetcher(synthetic_zim_path):
+    with Archive.open(synthetic_zim_path) as archive:
+        numbers = list(range(archive.clusterCount))
+        prefetched = list(ClusterPrefetcher(archive, depth=3))
+        assert [number for number, _ in prefetched] == numbers
+        for number, cluster in prefetched:
+            assert cluster.fully_decompressed
+            expected = Cluster(archive.buf, archive.clusterPtrList[number])
+            assert cluster.data[0] == expected.data[0]
+
+        assert [
+            (d.url, blob) for d, blob in archive.iter_articles_by_cluster(prefetch=3)
+        ] == [(d.url, blob) for d, blob in archive.iter_articles_by_cluster()]
+
+
+def test_prefetcher_backpressure(synthetic_zim_path, monkeypatch):
+    loaded = []
+    lock = threading.Lock()
+    load_cluster = prefetch._load_cluster
+
+    def counting_load_cluster(buf, offset):
+        with lock:
+            loaded.append(offset)
+        return load_cluster(buf, offset)
+
+    monkeypatch.setattr(prefetch, "_load_cluster", counting_load_cluster)
+    with Archive.open(synthetic_zim_path) as archive:
+        assert archive.clusterCount > 10
+        clusters = iter(ClusterPrefetcher(archive, depth=4, workers=2))
+        next(clusters)
+        time.sleep(0.1)
+        # The consumer is slow, only the next clusters are loaded.
+        assert len(loaded) <= 4
+        next(clusters)
+        time.sleep(0.1)
+        assert len(loaded) <= 5
+        clusters.close()
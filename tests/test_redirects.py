@@ -0,0 +1,96 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pyzim import Archive, RedirectTable, REDIRECT_LOOP, REDIRECT_DANGLING
+from pyzim import redirects
+from .test_sample import sampleZim_content
+
+
+def with_redirect_index(index):
+    # Change the redirect index of the second dirent of the sample.
+    content = bytearray(sampleZim_content)
+    content[168:172] = index.to_bytes(4, "little")
+    return bytes(content)
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        (sampleZim_content, [0, 0, 2]),
+        (with_redirect_index(2), [0, 2, 2]),
+        (with_redirect_index(1), [0, REDIRECT_LOOP, 2]),
+        (with_redirect_index(3), [0, REDIRECT_DANGLING, 2]),
+    ],
+)
+def test_build(content, expected):
+    archive = Archive(content)
+    assert redirects._build_python(archive).tolist() == expected
+    if redirects.numpy is not None:
+        assert redirects._build_numpy(archive).tolist() == expected
+
+
+def test_resolve_redirect():
+    archive = Archive(with_redirect_index(1))
+    assert archive.resolve_redirect(0) == 0
+    assert archive.resolve_redirect(2) == 2
+    with pytest.raises(IndexError):
+        archive.resolve_redirect(1)
+    with pytest.raises(IndexError):
+        archive.resolve_redirect(3)
+
+
+def test_save_load(zim_path):
+    with Archive.open(zim_path) as archive:
+        assert archive.redirectTable is None
+        archive.save_redirect_table()
+    with Archive.open(zim_path) as archive:
+        assert archive.redirectTable is not None
+        assert list(archive.redirectTable.table) == [0, 0, 2]
+        assert archive.resolve_redirect(1) == 0
+
+    # Same content, other uuid.
+    other = Archive(sampleZim_content[:8] + bytes(16) + sampleZim_content[24:])
+    with pytest.raises(ValueError):
+        RedirectTable.load(str(zim_path) + ".redirects", other.header)
+
+
+def test_save_temporary_file(zim_path):
+    with Archive.open(zim_path) as archive:
+        # Threads saving the table at the same time don't collide.
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda _: archive.save_redirect_table(), range(4)))
+        assert sorted(os.listdir(zim_path.parent)) == [
+            "sample.zim",
+            "sample.zim.redirects",
+        ]
+
+        class FailingArray(array):
+            def tofile(self, f):
+                raise OSError("disk full")
+
+        table = RedirectTable(FailingArray("I", [0, 0, 2]))
+        with pytest.raises(OSError):
+            table.save(str(zim_path) + ".other", archive.header)
+        assert sorted(os.listdir(zim_path.parent)) == [
+            "sample.zim",
+            "sample.zim.redirects",
+        ]
@@ -0,0 +1,124 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import http.client
+import threading
+from struct import pack
+
+import pytest
+from pyzim import Archive
+from pyzim.server import ZimHTTPServer, parse_range
+from .test_sample import sampleZim_content
+
+
+def uncompressed_sample():
+    # Replace the xz cluster of the sample (at 0xd6) by an uncompressed one.
+    blobs = [b"<h1>Auto</h1>", b"Auto"]
+    cluster = bytes([1]) + pack("<III", 12, 25, 29) + b"".join(blobs)
+    content = bytearray(sampleZim_content[:0xD6] + cluster)
+    content[72:80] = pack("<Q", len(content))
+    return bytes(content + hashlib.md5(content).digest())
+
+
+@pytest.fixture(params=["compressed", "uncompressed"])
+def server(request, tmp_path):
+    path = tmp_path / "sample.zim"
+    if request.param == "compressed":
+        path.write_bytes(sampleZim_content)
+    else:
+        path.write_bytes(uncompressed_sample())
+    with Archive.open(path) as archive:
+        with ZimHTTPServer(("127.0.0.1", 0), archive) as server:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            yield server
+            server.shutdown()
+            thread.join()
+
+
+def request(server, path, headers={}, method="GET"):
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+    connection.request(method, path, headers=headers)
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response, body
+
+
+def test_get(server):
+    response, body = request(server, "/A/Auto")
+    assert response.status == 200
+    assert body == b"<h1>Auto</h1>"
+    assert response.getheader("Content-Type") == "text/html"
+    etag = response.getheader("ETag")
+
+    response, body = request(server, "/B/Auto")
+    assert body == b"Auto"
+    assert response.getheader("Content-Type") == "text/plain"
+    assert response.getheader("ETag") != etag
+
+    response, body = request(server, "/A/Auto", {"If-None-Match": etag})
+    assert response.status == 304
+
+    response, body = request(server, "/A/Auto", method="HEAD")
+    assert response.status == 200
+    assert response.getheader("Content-Length") == "13"
+    assert body == b""
+
+
+def test_redirect_and_missing(server):
+    response, _ = request(server, "/A/Automobile")
+    assert response.status == 302
+    assert response.getheader("Location") == "/A/Auto"
+    assert request(server, "/A/Nothing")[0].status == 404
+    assert request(server, "/AB/Auto")[0].status == 404
+    assert request(server, "/")[0].status == 404
+
+
+def test_range(server):
+    response, body = request(server, "/A/Auto", {"Range": "bytes=4-7"})
+    assert response.status == 206
+    assert body == b"Auto"
+    assert response.getheader("Content-Range") == "bytes 4-7/13"
+    response, body = request(server, "/A/Auto", {"Range": "bytes=-5"})
+    assert body == b"</h1>"
+    response, body = request(server, "/A/Auto", {"Range": "bytes=13-"})
+    assert response.status == 416
+    response, body = request(server, "/A/Auto", {"Range": "bytes=5-3"})
+    assert response.status == 200
+    assert body == b"<h1>Auto</h1>"
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-", 10) == (0, 10)
+    assert parse_range("bytes=2-4", 10) == (2, 5)
+    assert parse_range("bytes=2-40", 10) == (2, 10)
+    assert parse_range("bytes=-3", 10) == (7, 10)
+    assert parse_range("bytes=0-1,4-5", 10) is None
+    assert parse_range("lines=0-1", 10) is None
+    # Last position before the first one: invalid, ignored.
+    assert parse_range("bytes=5-3", 10) is None
+    assert parse_range("bytes=15-3", 10) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=10-", 10)
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 10)
+    # Nothing can be satisfied in an empty blob.
+    for value in ("bytes=-3", "bytes=0-", "bytes=0-0"):
+        with pytest.raises(ValueError):
+            parse_range(value, 0)
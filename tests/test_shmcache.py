@@ -0,0 +1,97 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from pyzim import Archive, SharedClusterCache, metrics
+
+pytest.importorskip("fcntl")
+
+
+@pytest.fixture
+def cache_name():
+    name = "pyzim-test-{}".format(os.getpid())
+    yield name
+    cache = SharedClusterCache(name)
+    cache.unlink()
+    cache.close()
+
+
+def test_get_put(cache_name):
+    uuid = bytes(range(16))
+    with SharedClusterCache(cache_name, size=4096, nb_slots=8) as cache:
+        assert cache.get(uuid, 1) is None
+        assert cache.put(uuid, 1, b"one" * 100)
+        assert cache.get(uuid, 1) == b"one" * 100
+        assert cache.get(bytes(16), 1) is None
+        assert not cache.put(uuid, 2, bytes(cache.data_size + 1))
+        # Another handle on the same segment.
+        with SharedClusterCache(cache_name) as other:
+            assert other.data_size == cache.data_size
+            assert other.get(uuid, 1) == b"one" * 100
+            other.put(uuid, 2, b"two")
+        assert cache.get(uuid, 2) == b"two"
+        assert cache.stats["hits"] == 2
+
+
+def test_eviction(cache_name):
+    uuid = bytes(16)
+    with SharedClusterCache(cache_name, size=4096, nb_slots=16) as cache:
+        data_size = cache.data_size
+        blob = bytes(data_size // 3)
+        for number in range(10):
+            assert cache.put(uuid, number, bytes([number]) + blob)
+        # Only the last ones are still in the ring.
+        assert cache.get(uuid, 0) is None
+        assert cache.get(uuid, 9) == bytes([9]) + blob
+        assert cache.get(uuid, 8) == bytes([8]) + blob
+
+
+def _read_all(path, cache_name):
+    with SharedClusterCache(cache_name) as cache:
+        with Archive.open(path, shared_cache=cache) as archive:
+            dirent = archive.get_dirent(archive.find_by_url("A", "Auto"))
+            return archive.get_blob_data(dirent)
+
+
+def test_archive_shared_cache(zim_path, cache_name):
+    SharedClusterCache(cache_name, size=1024 * 1024).close()
+    with ProcessPoolExecutor(1) as executor:
+        blob = executor.submit(_read_all, zim_path, cache_name).result()
+
+    sink = metrics.HistogramSink()
+    metrics.enable(sink)
+    try:
+        assert _read_all(zim_path, cache_name) == blob
+    finally:
+        metrics.disable()
+    # Decompressed by the other process.
+    assert sink.snapshot().get(
+        ("cluster_decompress_bytes", (("compression", "xz"),))
+    ) is None
+
+
+def test_archive_shared_cache_no_local_copy(zim_path, cache_name):
+    with SharedClusterCache(cache_name, size=1024 * 1024) as cache:
+        with Archive.open(zim_path, shared_cache=cache) as archive:
+            dirent = archive.get_dirent(archive.find_by_url("A", "Auto"))
+            assert archive.get_blob_data(dirent) == b"<h1>Auto</h1>"
+            assert archive.get_blob_data(dirent) == b"<h1>Auto</h1>"
+            assert len(archive.cache) == 0
+            assert cache.stats["hits"] == 1
@@ -0,0 +1,77 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+
+import pytest
+from pyzim import Archive, verify_checksum
+from pyzim.bench import main as bench_main
+from pyzim.check import check_archive
+from pyzim.synthetic import generate_zim
+
+
+@pytest.fixture(params=["none", "xz", "zstd"])
+def cluster_compression(request):
+    if request.param == "zstd":
+        try:
+            import compression.zstd  # noqa: F401
+        except ImportError:
+            pytest.importorskip("pyzstd")
+    return request.param
+
+
+def test_generate_zim(tmp_path, cluster_compression):
+    path = tmp_path / "synthetic.zim"
+    summary = generate_zim(
+        path,
+        articles=200,
+        cluster_size=16 * 1024,
+        blob_size=1024,
+        compression=cluster_compression,
+    )
+    assert summary["articles"] == 200
+    assert summary["redirects"] == 20
+    assert summary["clusters"] > 1
+    assert list(check_archive(path, workers=1)) == []
+    assert verify_checksum(path)
+    with Archive.open(path) as archive:
+        assert archive.articleCount == 220
+        articles = list(archive.iter_articles_by_cluster())
+        assert len(articles) == 200
+        dirent, blob = articles[0]
+        assert archive.get_blob_data(dirent) == blob
+        assert archive.find_by_url(dirent.namespace, dirent.url) is not None
+
+
+def test_generate_zim_deterministic(tmp_path):
+    generate_zim(tmp_path / "a.zim", articles=50, seed=3)
+    generate_zim(tmp_path / "b.zim", articles=50, seed=3)
+    generate_zim(tmp_path / "c.zim", articles=50, seed=4)
+    content = (tmp_path / "a.zim").read_bytes()
+    assert content == (tmp_path / "b.zim").read_bytes()
+    assert content != (tmp_path / "c.zim").read_bytes()
+
+
+def test_bench(tmp_path):
+    output = tmp_path / "bench.json"
+    bench_main(["--articles", "100", "--lookups", "10", "-o", str(output)])
+    report = json.loads(output.read_text())
+    assert report["archive"]["articles"] == 100
+    for name in ("open", "find_by_url", "find_by_title", "blob_read_cold"):
+        assert report["results"][name]["count"] > 0
+    assert report["results"]["iteration"]["articles"] == 100
+    assert report["results"]["iteration_prefetch"]["articles"] == 100
@@ -0,0 +1,67 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pyzim import Archive, UrlIndex, build_url_index
+from .test_sample import sampleZim_content
+
+
+def test_build_url_index(zim_path):
+    with Archive.open(zim_path) as archive:
+        assert archive.urlIndex is None
+        index = build_url_index(archive)
+        assert sorted(index.candidates(b"A", "Automobile")) == [1]
+        index.close()
+
+    with Archive.open(zim_path) as archive:
+        assert archive.urlIndex is not None
+        assert archive.find_by_url(b"A", "Auto") == 0
+        assert archive.find_by_url(b"A", "Automobile") == 1
+        assert archive.find_by_url(b"B", "Auto") == 2
+        with pytest.raises(IndexError):
+            archive.find_by_url(b"B", "Automobile")
+
+
+def test_url_index_other_archive(zim_path):
+    with Archive.open(zim_path) as archive:
+        build_url_index(archive).close()
+
+    other_content = bytearray(sampleZim_content)
+    other_content[8] ^= 0xFF  # Change the uuid
+    with Archive(other_content) as other:
+        with pytest.raises(ValueError):
+            UrlIndex(str(zim_path) + ".urlidx", other.header)
+
+
+def test_build_url_index_temporary_file(zim_path, monkeypatch):
+    with Archive.open(zim_path) as archive:
+        # Threads building the index at the same time don't collide.
+        with ThreadPoolExecutor(4) as executor:
+            for index in executor.map(lambda _: build_url_index(archive), range(4)):
+                index.close()
+        assert sorted(os.listdir(zim_path.parent)) == ["sample.zim", "sample.zim.urlidx"]
+
+        def fail(index):
+            raise RuntimeError("build failure")
+
+        monkeypatch.setattr(archive.urlSearch, "key", fail)
+        with pytest.raises(RuntimeError):
+            build_url_index(archive, str(zim_path) + ".other")
+        assert sorted(os.listdir(zim_path.parent)) == ["sample.zim", "sample.zim.urlidx"]
@@ -0,0 +1,120 @@
+# coding=utf-8
+
+# This file is part of pyzim-tools.
+#
+# pyzim-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# pyzim-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyzim-tools.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pytest
+from pyzim import Archive, Cluster, Creator, Dirent, Header, verify_checksum
+from pyzim.check import check_archive
+
+
+def create(path, **kwargs):
+    kwargs.setdefault("compression", "xz")
+    with Creator(path, **kwargs) as creator:
+        creator.add_metadata("Title", "Test archive")
+        creator.add_article("A", "Zebra", "A zebra", "text/html", b"<p>zebra</p>")
+        creator.add_article("A", "Apple", "", "text/html", b"<p>apple</p>" * 100)
+        creator.add_article("I", "logo.png", "", "image/png", b"\x89PNG" + bytes(50))
+        creator.add_redirect("A", "Pomme", "Pomme", "A", "Apple")
+        creator.add_redirect("A", "Fruit", "", "A", "Pomme")
+        creator.set_main_page("A", "Zebra")
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_round_trip(tmp_path, workers):
+    path = tmp_path / "test.zim"
+    create(path, workers=workers, cluster_size=100, sort_run_size=2)
+    assert list(check_archive(path, workers=1)) == []
+    assert verify_checksum(path)
+
+    content = path.read_bytes()
+    header = Header(content, 0)
+    assert header.articleCount == 6
+    assert header.checksumPos == len(content) - 16
+
+    with Archive.open(path) as archive:
+        urls = [
+            (d.namespace, d.url) for d in map(archive.get_dirent, range(6))
+        ]
+        assert urls == [
+            (b"A", "Apple"),
+            (b"A", "Fruit"),
+            (b"A", "Pomme"),
+            (b"A", "Zebra"),
+            (b"I", "logo.png"),
+            (b"M", "Title"),
+        ]
+        main_page = archive.get_dirent(archive.header.mainPage)
+        assert main_page.url == "Zebra"
+        assert archive.get_blob_data(main_page) == b"<p>zebra</p>"
+        fruit = archive.get_dirent(archive.find_by_url("A", "Fruit"))
+        assert fruit.redirect_index == archive.find_by_url("A", "Pomme")
+        assert archive.resolve_redirect(1) == 0
+        title_index = archive.find_by_title("A", "A zebra")
+        assert archive.get_dirent_by_title(title_index).url == "Zebra"
+        metadata = archive.get_dirent(archive.find_by_url("M", "Title"))
+        assert archive.get_mimetype(metadata) == "text/plain"
+        assert archive.get_blob_data(metadata) == b"Test archive"
+
+        logo = archive.get_dirent(4)
+        assert archive.get_mimetype(logo) == "image/png"
+        cluster = Cluster(archive.buf, archive.clusterPtrList[logo.clusterNumber])
+        assert not cluster.compressed
+        assert cluster.get_blob_data(logo.blobNumber) == b"\x89PNG" + bytes(50)
+
+        apple_offset = archive.urlPtrList[0]
+        apple = Dirent(archive.buf, apple_offset)
+        cluster = Cluster(archive.buf, archive.clusterPtrList[apple.clusterNumber])
+        assert cluster.compression == 4
+        assert cluster.get_blob_data(apple.blobNumber) == b"<p>apple</p>" * 100
+
+
+def test_same_content_with_workers(tmp_path):
+    create(tmp_path / "a.zim", workers=0, uuid=bytes(16), cluster_size=100)
+    create(tmp_path / "b.zim", workers=2, uuid=bytes(16), cluster_size=100)
+    assert (tmp_path / "a.zim").read_bytes() == (tmp_path / "b.zim").read_bytes()
+
+
+def test_errors(tmp_path):
+    with pytest.raises(ValueError):
+        Creator(tmp_path / "test.zim", compression="bzip2")
+
+    creator = Creator(tmp_path / "dup.zim", workers=0)
+    creator.add_article("A", "a", "", "text/html", b"a")
+    creator.add_article("A", "a", "", "text/html", b"b")
+    with pytest.raises(ValueError, match="Duplicate"):
+        creator.finish()
+
+    creator = Creator(tmp_path / "missing.zim", workers=0)
+    creator.add_redirect("A", "a", "", "A", "b")
+    with pytest.raises(ValueError, match="Missing redirect target"):
+        creator.finish()
+    with pytest.raises(ValueError):
+        creator.add_article("A", "b", "", "text/html", b"b")
+
+
+@pytest.mark.parametrize("mimelist_size", [4096, 0])
+def test_mimelist_after_header(tmp_path, mimelist_size):
+    path = tmp_path / "test.zim"
+    create(path, workers=0, cluster_size=100, mimelist_size=mimelist_size)
+    assert list(check_archive(path, workers=1)) == []
+    assert verify_checksum(path)
+    with Archive.open(path) as archive:
+        assert archive.header.mimeListPos == 80
+        assert list(archive.mimetypes) == ["text/plain", "text/html", "image/png"]
+        metadata = archive.get_dirent(archive.find_by_url("M", "Title"))
+        assert archive.get_blob_data(metadata) == b"Test archive"
+        apple = archive.get_dirent(archive.find_by_url("A", "Apple"))
+        assert archive.get_blob_data(apple) == b"<p>apple</p>" * 100